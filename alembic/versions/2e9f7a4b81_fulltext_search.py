@@ -0,0 +1,37 @@
+revision = '2e9f7a4b81'
+down_revision = '5d8a3c6f19'
+
+from alembic import op
+
+FULLTEXT_COLUMNS = [
+    ('person', 'romania_curata'),
+    ('transcript', 'text'),
+    ('ocr_text', 'text'),
+    ('question', 'title'),
+]
+
+
+def upgrade():
+    for table, column in FULLTEXT_COLUMNS:
+        names = {'table': table, 'column': column}
+        op.execute("ALTER TABLE {table} ADD COLUMN {column}_tsv tsvector"
+                   .format(**names))
+        op.execute("UPDATE {table} SET {column}_tsv = "
+                   "to_tsvector('pg_catalog.romanian', coalesce({column}, ''))"
+                   .format(**names))
+        op.execute("CREATE INDEX {table}_{column}_tsv_index ON {table} "
+                   "USING gin({column}_tsv)".format(**names))
+        op.execute("CREATE TRIGGER {table}_{column}_tsv_update "
+                   "BEFORE INSERT OR UPDATE OF {column} ON {table} "
+                   "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger("
+                   "{column}_tsv, 'pg_catalog.romanian', {column})"
+                   .format(**names))
+
+
+def downgrade():
+    for table, column in reversed(FULLTEXT_COLUMNS):
+        names = {'table': table, 'column': column}
+        op.execute("DROP TRIGGER {table}_{column}_tsv_update ON {table}"
+                   .format(**names))
+        op.execute("ALTER TABLE {table} DROP COLUMN {column}_tsv"
+                   .format(**names))
@@ -0,0 +1,14 @@
+revision = '3f1c2b9d8e'
+down_revision = '67fb47689b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('transcript',
+        sa.Column('fingerprint', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('transcript', 'fingerprint')
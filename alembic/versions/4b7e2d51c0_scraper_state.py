@@ -0,0 +1,19 @@
+revision = '4b7e2d51c0'
+down_revision = '3f1c2b9d8e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'scraper_state',
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('value', sa.Text(), nullable=True),
+        sa.Column('updated', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('scraper_state')
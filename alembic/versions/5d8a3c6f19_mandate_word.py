@@ -0,0 +1,45 @@
+revision = '5d8a3c6f19'
+down_revision = '4b7e2d51c0'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table(
+        'mandate_word',
+        sa.Column('mandate_id', postgresql.UUID(), nullable=False),
+        sa.Column('word', sa.Text(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['mandate_id'], ['mandate.id']),
+        sa.PrimaryKeyConstraint('mandate_id', 'word'),
+    )
+    op.create_index('mandate_word_mandate_id_count_index', 'mandate_word',
+                    ['mandate_id', 'count'])
+    op.execute(r"""
+        WITH proposal_words AS (
+            SELECT ocr_text.id AS proposal_id,
+                   unnest(regexp_split_to_array(lower(text), '\M\W*\m'))
+                       AS word
+            FROM ocr_text
+            WHERE ocr_text.parent = 'proposal'
+        ),
+        proposal_word_counts AS (
+            SELECT proposal_id, word, count(*) AS n FROM proposal_words
+            WHERE char_length(word) > 4
+            GROUP BY proposal_id, word
+        )
+        INSERT INTO mandate_word (mandate_id, word, count)
+        SELECT sponsorship.mandate_id, proposal_word_counts.word,
+               sum(proposal_word_counts.n)
+        FROM proposal_word_counts
+        JOIN sponsorship
+          ON sponsorship.proposal_id = proposal_word_counts.proposal_id
+        GROUP BY sponsorship.mandate_id, proposal_word_counts.word
+    """)
+
+
+def downgrade():
+    op.drop_index('mandate_word_mandate_id_count_index')
+    op.drop_table('mandate_word')
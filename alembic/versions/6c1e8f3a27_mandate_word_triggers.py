@@ -0,0 +1,23 @@
+revision = '6c1e8f3a27'
+down_revision = '2e9f7a4b81'
+
+from alembic import op
+
+
+def upgrade():
+    from mptracker.models import (MANDATE_WORD_TRIGGER_DDL,
+                                  REBUILD_MANDATE_WORDS_SQL)
+    for ddl_list in MANDATE_WORD_TRIGGER_DDL.values():
+        for ddl in ddl_list:
+            op.execute(ddl)
+    # the ORM events that came before missed bulk loads and deletes
+    op.execute("DELETE FROM mandate_word")
+    op.execute(REBUILD_MANDATE_WORDS_SQL)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER sponsorship_mandate_word_update ON sponsorship")
+    op.execute("DROP TRIGGER ocr_text_mandate_word_update ON ocr_text")
+    op.execute("DROP FUNCTION mandate_word_sponsorship_trigger()")
+    op.execute("DROP FUNCTION mandate_word_ocr_text_trigger()")
+    op.execute("DROP FUNCTION mandate_word_add(text, uuid, integer)")
@@ -0,0 +1,103 @@
+""" Time the tokenizer and `NameMatcher.match` on the inputs of
+`testsuite/test_match_names.py`, repeated until each text is the size of a
+full OCR'd question. Run it from the project root:
+
+    python -m benchmarks.match_names
+
+The old way of preparing tokens (a `str.replace` pass per character in
+`name_normalization_map`, then stemming, for every token) is timed against
+`tokenize_normalized`, after checking that both give the same forms.
+"""
+
+import sys
+import time
+from mptracker.nlp import (NameMatcher, tokenize, tokenize_normalized,
+                           name_normalization_map, simple_stem)
+
+DOCUMENT_SIZE = 20000  # characters, about four pages of OCR text
+ROUNDS = 20
+
+CASES = [
+    ("hello somethingthere world",
+     [], ['foo', 'somethingthere', 'bar'], {}),
+    ("hello theer world",
+     [], ['there', 'theer'], {}),
+    ("foo bar baz blah blah blah Domnul VIRGIL GURAN, Deputat PNL "
+     "Prahova Obiectul întrebării Modificarea Legii Sinaia foo bar",
+     ['prahova', 'sinaia'], [],
+     {'name': "Guran Virgil", 'county_name': "Prahova"}),
+    ("Domnul VIRGIL GURAN, foo bar baz blah blah blah Deputat PNL "
+     "Prahova Obiectul întrebării Modificarea Legii Sinaia foo bar",
+     ['prahova', 'sinaia'], [], {'county_name': "Prahova"}),
+    ("foo bar brașov campina hello world",
+     [], ["brasov", "câmpina"], {}),
+    ("let's match a complicated bit of text",
+     [], ["complicated bit"], {}),
+    ("something fishy at Cluj-Napoca today",
+     ["Cluj-Napoca"], [], {}),
+    ("azi Argeșenele se revoltă",
+     ['Argeș'], [], {}),
+]
+
+
+def scale(text):
+    return ' '.join([text] * (DOCUMENT_SIZE // (len(text) + 1) + 1))
+
+
+def replace_normalize(name):
+    name = name.lower()
+    for ch, new_ch in name_normalization_map:
+        name = name.replace(ch, new_ch)
+    return name
+
+
+def old_forms(text):
+    rv = []
+    for token in tokenize(text):
+        norm = replace_normalize(token.text)
+        rv.append((norm, norm.split(' '),
+                   [simple_stem(w) for w in norm.split()]))
+    return rv
+
+
+def new_forms(text):
+    return [(t.norm, t.words, t.stems) for t in tokenize_normalized(text)]
+
+
+def measure(func, args_list):
+    t0 = time.perf_counter()
+    for n in range(ROUNDS):
+        for args in args_list:
+            func(*args)
+    return (time.perf_counter() - t0) / (ROUNDS * len(args_list))
+
+
+def main():
+    documents = [scale(text) for (text, _, _, _) in CASES]
+    for document in documents:
+        if old_forms(document) != new_forms(document):
+            print("MISMATCH:", document[:60])
+            sys.exit(1)
+    n_words = sum(len(d.split()) for d in documents)
+    print("%d documents, %d words, token forms identical" %
+          (len(documents), n_words))
+
+    old_time = measure(old_forms, [(d,) for d in documents])
+    new_time = measure(new_forms, [(d,) for d in documents])
+    print("tokens   replace %7.3f ms/doc  translate %7.3f ms/doc  "
+          "speedup %.2fx" % (old_time * 1000, new_time * 1000,
+                             old_time / new_time))
+
+    match_args = [
+        (NameMatcher(name_list, phrase_list), document, mp_info)
+        for (document, (_, name_list, phrase_list, mp_info))
+        in zip(documents, CASES)
+    ]
+    match_time = measure(lambda m, d, i: m.match(d, mp_info=i), match_args)
+    print("match    %7.3f ms/doc  %8.0f words/s" %
+          (match_time * 1000,
+           n_words / len(documents) / match_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+""" Compare the old cdep.ro parsing path (decode from iso-8859-2, encode
+to utf-16, let lxml sniff it) with handing the raw bytes to lxml along with
+their encoding. Run it from the project root:
+
+    python -m benchmarks.parse_encoding
+
+Peak memory is measured with `tracemalloc`, so it covers the Python-side
+copies of the page (which is what changed), not libxml2's own tree.
+"""
+
+import sys
+import time
+import tracemalloc
+from path import path
+from pyquery import PyQuery as pq
+from mptracker.scraper.common import Scraper, parse_html
+
+PAGES_DIR = path(__file__).abspath().parent.parent / 'testsuite' / 'pages'
+ROUNDS = 20
+
+
+def parse_utf16(content):
+    text = content.decode(Scraper.cdep_encoding)
+    return pq(text.encode('utf-16'), parser='html')
+
+
+def parse_bytes(content):
+    return parse_html(content, Scraper.cdep_encoding)
+
+
+def measure(parse, pages):
+    tracemalloc.start()
+    peak = 0
+    t0 = time.perf_counter()
+    for n in range(ROUNDS):
+        for content in pages:
+            tracemalloc.reset_peak()
+            parse(content)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    elapsed = time.perf_counter() - t0
+    tracemalloc.stop()
+    return elapsed / (ROUNDS * len(pages)), peak
+
+
+def main():
+    # the HTML fixtures have no extension; skip the .json snapshots
+    page_paths = sorted(PAGES_DIR.listdir('steno.*[0-9]') +
+                        PAGES_DIR.listdir('proposal-*') +
+                        PAGES_DIR.listdir('structura-*'))
+    pages = [p.bytes() for p in page_paths]
+
+    for page_path, content in zip(page_paths, pages):
+        old = parse_utf16(content)
+        new = parse_bytes(content)
+        if old.text() != new.text() or old.outer_html() != new.outer_html():
+            print("MISMATCH:", page_path.name)
+            sys.exit(1)
+    print("%d pages, extracted text identical" % len(pages))
+
+    results = {
+        'utf-16': measure(parse_utf16, pages),
+        'bytes': measure(parse_bytes, pages),
+    }
+    for name, (per_page, peak) in results.items():
+        print("%-8s %7.3f ms/page, peak %6.1f kb" %
+              (name, per_page * 1000, peak / 1024))
+
+    (old_time, old_peak) = results['utf-16']
+    (new_time, new_peak) = results['bytes']
+    print("speedup %.2fx, peak memory %.2fx smaller" %
+          (old_time / new_time, old_peak / new_peak))
+
+
+if __name__ == '__main__':
+    main()
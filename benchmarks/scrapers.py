@@ -0,0 +1,200 @@
+""" Replay the captured pages in `testsuite/pages` through the scrapers and
+report throughput, per-page latency and peak memory for each parser. Run it
+from the project root:
+
+    python -m benchmarks.scrapers [results.json [baseline.json]]
+
+Results are written as JSON (to `results.json` if given) so a run on one
+commit can be compared with a run on another; when `baseline.json` is given
+the ratios are printed too. Each parser runs in its own child process so its
+peak RSS isn't inflated by the parsers that ran before it.
+"""
+
+import sys
+import json
+import time
+import resource
+import subprocess
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from path import path
+
+PROJECT_ROOT = path(__file__).abspath().parent.parent
+PAGES_DIR = PROJECT_ROOT / 'testsuite' / 'pages'
+ROUNDS = 10
+
+STENO_URL = 'http://www.cdep.ro/pls/steno/'
+PROPOSAL_URL = 'http://www.cdep.ro/pls/proiecte/upl_pck.proiect?idp=%d&cam=%d'
+GROUP_URL = 'http://www.cdep.ro/pls/parlam/structura.gp?idg=%d&leg=2012'
+
+
+class FakeResponse:
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeSession:
+    """ Serves fixture pages from memory, so we time the parsers and not the
+    disk or the network. """
+
+    def __init__(self):
+        self.pages = {}
+        self.hooks = []
+
+    def add(self, url, name):
+        self.pages[url] = (PAGES_DIR / name).bytes()
+
+    def get(self, url, hooks=[]):
+        return FakeResponse(self.pages[url])
+
+
+def transcripts():
+    from mptracker.scraper.transcripts import TranscriptScraper
+    session = FakeSession()
+    session.add(STENO_URL + 'steno.sumar?ids=7277', 'steno.sumar-7277')
+    for n in range(1, 13):
+        session.add(STENO_URL + 'steno.stenograma?ids=7277&idm=%d&idl=1' % n,
+                    'steno.stenograma-7277-%d' % n)
+    scraper = TranscriptScraper(session)
+
+    def run():
+        scraper.fetch_session(7277)
+
+    return len(session.pages), [run]
+
+
+def proposals():
+    from mptracker.scraper.proposals import ProposalScraper
+    session = FakeSession()
+    args = []
+    for page_path in sorted(PAGES_DIR.listdir('proposal-[12]-*')):
+        [_, chamber, pk] = page_path.name.split('-')
+        args.append((int(chamber), int(pk)))
+        session.add(PROPOSAL_URL % (int(pk), int(chamber)), page_path.name)
+    scraper = ProposalScraper(session)
+
+    def page_runner(chamber, pk):
+        return lambda: scraper.scrape_proposal_page(chamber, pk)
+
+    return len(args), [page_runner(*a) for a in args]
+
+
+def groups():
+    from mptracker.scraper.groups import GroupScraper
+    session = FakeSession()
+    urls = []
+    for page_path in sorted(PAGES_DIR.listdir('structura-group*')):
+        idg = int(page_path.name[len('structura-group'):])
+        urls.append(GROUP_URL % idg)
+        session.add(urls[-1], page_path.name)
+    scraper = GroupScraper(session)
+
+    def page_runner(url):
+        return lambda: scraper.fetch_group(url, 2012)
+
+    return len(urls), [page_runner(url) for url in urls]
+
+
+def tables():
+    from mptracker.scraper.common import TableParser
+    cases = [
+        ((PAGES_DIR / 'table_ppdd_members.html').text(), {}),
+        ((PAGES_DIR / 'table_committee_former_members.html').text(),
+         {'double_header': True}),
+    ]
+
+    def table_runner(html, kwargs):
+        return lambda: list(TableParser(html, **kwargs))
+
+    return len(cases), [table_runner(*c) for c in cases]
+
+
+PARSERS = {
+    'TranscriptScraper.fetch_session': transcripts,
+    'ProposalScraper.scrape_proposal_page': proposals,
+    'GroupScraper.fetch_group': groups,
+    'TableParser': tables,
+}
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[index]
+
+
+def measure(name):
+    n_pages, runners = PARSERS[name]()
+    for run in runners:
+        run()  # warm up, and fail early if a fixture no longer parses
+
+    latencies = []
+    t0 = time.perf_counter()
+    for n in range(ROUNDS):
+        for run in runners:
+            t = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - t0
+
+    # a runner may cover several pages (a transcript session is a summary
+    # page plus its chapters), so latency is reported per page
+    pages_per_run = n_pages / len(runners)
+    latencies = sorted(l / pages_per_run for l in latencies)
+    return {
+        'pages': n_pages,
+        'pages_per_sec': n_pages * ROUNDS / elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1000,
+            'p90': percentile(latencies, 90) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': latencies[-1] * 1000,
+        },
+        # ru_maxrss is in kilobytes on linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=PROJECT_ROOT, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    results = {
+        'revision': git_revision(),
+        'date': datetime.utcnow().isoformat(),
+        'rounds': ROUNDS,
+        'parsers': {},
+    }
+    for name in PARSERS:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results['parsers'][name] = executor.submit(measure, name).result()
+
+    baseline = None
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            baseline = json.load(f)['parsers']
+
+    for name, row in results['parsers'].items():
+        latency = row['latency_ms']
+        line = ("%-38s %8.1f pages/s  p50 %6.2f  p90 %6.2f  p99 %6.2f ms  "
+                "rss %6.1f mb" % (name, row['pages_per_sec'], latency['p50'],
+                                  latency['p90'], latency['p99'],
+                                  row['peak_rss_kb'] / 1024))
+        if baseline and name in baseline:
+            line += "  (%.2fx throughput)" % (
+                row['pages_per_sec'] / baseline[name]['pages_per_sec'])
+        print(line)
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
+import os
 import pytest
+import flask
 from mock import Mock
 
 
@@ -17,3 +19,27 @@ class MockSession:
 @pytest.fixture
 def session():
     return MockSession()
+
+
+@pytest.fixture
+def pg_app(request):
+    """ An app on the PostgreSQL database in `MPTRACKER_TEST_DATABASE`,
+    with the schema created; the tests using it are skipped without one. """
+    from mptracker import models
+    database = os.environ.get('MPTRACKER_TEST_DATABASE')
+    if not database:
+        pytest.skip("MPTRACKER_TEST_DATABASE is not set")
+    app = flask.Flask('__main__')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    models.db.init_app(app)
+    ctx = app.app_context()
+    ctx.push()
+    models.db.create_all()
+
+    def teardown():
+        models.db.session.remove()
+        models.db.drop_all()
+        ctx.pop()
+
+    request.addfinalizer(teardown)
+    return app
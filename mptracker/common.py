@@ -1,5 +1,8 @@
 from datetime import date, datetime
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
 import subprocess
 import tempfile
 import csv
@@ -18,6 +21,19 @@ from babel.dates import format_date
 from path import path
 
 MAX_OCR_PAGES = 3
+OCR_LANGUAGE = 'ron'
+# bump to make `ocr_url` ignore the texts in the OCR cache, e.g. after
+# upgrading tesseract
+OCR_CACHE_VERSION = 2
+# a page's embedded text is used instead of OCR if it has this many
+# letters and digits, and enough of its words look like real words (as
+# opposed to the garbage that PDFs with broken font encodings give)
+TEXT_LAYER_MIN_CHARS = 100
+TEXT_LAYER_MIN_WORD_RATIO = .5
+text_layer_word = re.compile(r'^\W*(?=[\w-]*[aeiouyăâî])'
+                             r'[^\W\d_]+(?:-[^\W\d_]+)*\W*$',
+                             re.IGNORECASE)
+text_layer_char = re.compile(r'[^\W_]')
 
 common = flask.Blueprint('common', __name__)
 
@@ -178,40 +194,145 @@ def temp_dir():
         tmp.rmtree()
 
 
-@job
-def ocr_url(url, max_pages=MAX_OCR_PAGES):
-    from mptracker.scraper.common import create_session
+def ocr_image(image_path, lang=OCR_LANGUAGE):
+    # each tesseract gets one core; the pages are spread across cores
+    env = dict(os.environ, OMP_THREAD_LIMIT='1')
+    subprocess.check_call(['tesseract',
+                           image_path, image_path,
+                           '-l', lang],
+                          stderr=subprocess.DEVNULL, env=env)
+    return (image_path + '.txt').text()
+
+
+def pdf_text_layer(pdf_path, max_pages):
+    """ The embedded text of each of the first `max_pages` pages, or `None`
+    if pdftotext can't read the file. """
+    try:
+        out = subprocess.check_output(['pdftotext', '-enc', 'UTF-8',
+                                       '-f', '1', '-l', str(max_pages),
+                                       pdf_path, '-'],
+                                      stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # every page ends with a form feed
+    return out.decode('utf-8', 'replace').split('\f')[:-1]
+
+
+def is_usable_text(text):
+    if len(text_layer_char.findall(text)) < TEXT_LAYER_MIN_CHARS:
+        return False
+    words = text.split()
+    real_words = sum(1 for w in words if text_layer_word.match(w))
+    return real_words / len(words) >= TEXT_LAYER_MIN_WORD_RATIO
 
-    pdf_cache_name = flask.current_app.config.get('MPTRACKER_PDF_CACHE')
+
+@job
+def ocr_url(url, max_pages=MAX_OCR_PAGES, lang=OCR_LANGUAGE, stats=None):
+    """ Download the PDF at `url` and return the text of its first
+    `max_pages` pages. A page's embedded text is used if it looks right
+    (see `is_usable_text`), otherwise its images are OCR'd. If given,
+    `stats` is updated with the method used for each page, `text` or
+    `ocr`, and whether the result came from the cache.
+
+    Results are cached in `_data/ocr.sqlite`, keyed on the PDF's md5,
+    `lang`, `max_pages` and `OCR_CACHE_VERSION`, so a document linked from
+    several places is only processed once; set `MPTRACKER_OCR_CACHE` to a
+    false value to turn that off. """
+    if stats is None:
+        stats = {}
+    from mptracker.scraper.common import create_session, create_ocr_cache
+
+    config = flask.current_app.config
+    pdf_cache_name = config.get('MPTRACKER_PDF_CACHE')
     http_session = create_session(cache_name=pdf_cache_name, throttle=0.5)
+    if config.get('MPTRACKER_OCR_CACHE', True):
+        ocr_cache = create_ocr_cache()
+    else:
+        ocr_cache = None
+    workers = config.get('MPTRACKER_OCR_WORKERS') or os.cpu_count() or 1
 
     with temp_dir() as tmp:
-        resp = http_session.get(url)
+        resp = http_session.get(url, stream=True)
         if resp.status_code == 404:
             # cdep.ro doesn't have the PDF; skip it
+            stats.update(methods=[], cached=False)
             return []
 
         if resp.status_code != 200:
             raise RuntimeError("PDF download failure (%d) at %r"
                                % (resp.status_code, url))
-        pdf_data = resp.content
         pdf_path = tmp / 'document.pdf'
         with pdf_path.open('wb') as f:
-            f.write(pdf_data)
-        subprocess.check_call(['pdfimages', pdf_path, tmp / 'img'])
+            for chunk in resp.iter_content(65536):
+                f.write(chunk)
+        if not getattr(resp, 'from_cache', False):
+            cache = getattr(http_session, 'cache', None)
+            if cache is not None:
+                cache.save_file(url, resp, pdf_path)
+
+        with pdf_path.open('rb') as f:
+            cache_key = '%s:%s:%d:%d' % (calculate_md5(iter_file(f)), lang,
+                                         max_pages, OCR_CACHE_VERSION)
+        if ocr_cache is not None:
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                stats.update(methods=cached['methods'], cached=True)
+                return cached['pages']
+
+        # for each page, its text if usable, or the images to OCR
+        page_texts = pdf_text_layer(pdf_path, max_pages)
+        if page_texts is None:
+            subprocess.check_call(['pdfimages', '-l', str(max_pages),
+                                   pdf_path, tmp / 'img'])
+            page_images = [[p] for p in sorted(tmp.listdir('img-*'))]
+            page_images = page_images[:max_pages]
+            page_texts = [''] * len(page_images)
+
+        else:
+            page_images = []
+            for n, text in enumerate(page_texts, 1):
+                if is_usable_text(text):
+                    page_images.append(None)
+                    continue
+                subprocess.check_call(['pdfimages', '-f', str(n),
+                                       '-l', str(n),
+                                       pdf_path, tmp / ('img-%d' % n)])
+                page_images.append(sorted(tmp.listdir('img-%d-*' % n)))
+
+        image_paths = [p for images in page_images if images for p in images]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            image_texts = dict(zip(image_paths, executor.map(
+                partial(ocr_image, lang=lang), image_paths)))
 
         pages = []
-        for image_path in sorted(tmp.listdir('img-*'))[:MAX_OCR_PAGES]:
-            subprocess.check_call(['tesseract',
-                                   image_path, image_path,
-                                   '-l', 'ron'],
-                                  stderr=subprocess.DEVNULL)
-            text = (image_path + '.txt').text()
-            pages.append(text)
-
+        methods = []
+        for text, images in zip(page_texts, page_images):
+            if images is None:
+                pages.append(text)
+                methods.append('text')
+            else:
+                pages.append('\n\n'.join(image_texts[p] for p in images))
+                methods.append('ocr')
+
+        if ocr_cache is not None:
+            ocr_cache.save(cache_key, {'pages': pages, 'methods': methods})
+        stats.update(methods=methods, cached=False)
         return pages
 
 
+def enqueue_ids(job_func, id_chunks, number=None):
+    """ Enqueue `job_func` for each id in `id_chunks` (see
+    `dbutil.iter_id_chunks`), up to `number` jobs. Returns the job count. """
+    n_jobs = 0
+    for ids in id_chunks:
+        for id in ids:
+            if number and n_jobs >= int(number):
+                return n_jobs
+            job_func.delay(id)
+            n_jobs += 1
+    return n_jobs
+
+
 def csv_lines(cols, rows):
     out = StringIO()
     writer = csv.DictWriter(out, cols)
@@ -1,8 +1,20 @@
 #import psycopg2.extensions
-from datetime import date
+import io
+from datetime import date, datetime
 import sqlalchemy.types
+from sqlalchemy.dialects.postgresql import UUID
 from flask import json
 
+COPY_TYPES = (
+    sqlalchemy.types.String,
+    sqlalchemy.types.Integer,
+    sqlalchemy.types.Numeric,
+    sqlalchemy.types.Boolean,
+    sqlalchemy.types.Date,
+    sqlalchemy.types.DateTime,
+    UUID,
+)
+
 
 class JsonString(sqlalchemy.types.TypeDecorator):
 
@@ -33,3 +45,65 @@ class InfDateAdapter:
 def register_infinity_adapter():
     psycopg2.extensions.register_adapter(date, InfDateAdapter)
     InfDateAdapter._adapter_registered = True
+
+
+def can_copy(column):
+    """ Can values of `column` be written with `copy_rows`? Types like
+    DATERANGE have no simple text form, so they go through INSERT. """
+    column_type = column.type
+    if isinstance(column_type, sqlalchemy.types.TypeDecorator):
+        column_type = column_type.impl
+    return isinstance(column_type, COPY_TYPES)
+
+
+def copy_text(value):
+    """ Format `value` for the text format of PostgreSQL's COPY """
+    if value is None:
+        return r'\N'
+    if value is True or value is False:
+        return 't' if value else 'f'
+    if isinstance(value, (date, datetime)):
+        if value == date.max:
+            return 'infinity'
+        if value == date.min:
+            return '-infinity'
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                      .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_rows(connection, table, columns, rows):
+    """ Write `rows` (tuples of bound values, in the order of `columns`)
+    into `table` using COPY, over the DBAPI connection of a SQLAlchemy
+    `connection`, so it happens in the same transaction. """
+    quote = connection.dialect.identifier_preparer.quote
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_text(value) for value in row) + '\n')
+    buffer.seek(0)
+    sql = 'COPY %s (%s) FROM STDIN' % (
+        quote(table.name), ', '.join(quote(c.name) for c in columns))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def iter_id_chunks(query, id_column, chunk_size=1000):
+    """ Run `query`, which selects `id_column`, a chunk at a time, yielding
+    lists of ids. Chunks are paged by id (not by OFFSET), so rows that
+    change while we're iterating don't shift the later chunks. """
+    last_id = None
+    while True:
+        chunk_query = query
+        if last_id is not None:
+            chunk_query = chunk_query.filter(id_column > last_id)
+        ids = [
+            row[0] for row in
+            chunk_query.order_by(id_column).limit(chunk_size).all()
+        ]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
@@ -4,6 +4,8 @@ import sys
 import logging
 import uuid
 import argparse
+from bisect import bisect_left
+from collections import defaultdict
 from datetime import datetime
 import flask
 from flask.ext.sqlalchemy import SQLAlchemy
@@ -15,8 +17,9 @@ from mptracker.common import (parse_date, parse_date_range,
 from mptracker.dbutil import JsonString, register_infinity_adapter
 from mptracker.nlp import normalize
 from sqlalchemy.dialects.postgresql import UUID, DATERANGE
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm.collections import attribute_mapped_collection
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, DDL, event
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -215,6 +218,7 @@ class Transcript(db.Model):
     id = db.Column(UUID, primary_key=True, default=random_uuid)
     text = db.Column(db.Text)
     serial = db.Column(db.Text, index=True)
+    fingerprint = db.Column(db.Text)
 
     chapter_id = db.Column(UUID, db.ForeignKey('transcript_chapter.id'))
     chapter = db.relationship('TranscriptChapter',
@@ -617,6 +621,178 @@ class ScrapedProposalPage(db.Model):
     parsed = db.Column(db.Boolean, nullable=False, default=False)
 
 
+class ScraperState(db.Model):
+    """ Where a scraper command stopped, so an interrupted run can resume.
+    Like `mandate_word`, it's left out of `dump_tables` and `load`. """
+    name = db.Column(db.Text, primary_key=True)
+    value = db.Column(JsonString)
+    updated = db.Column(db.DateTime, default=lambda: datetime.utcnow())
+
+    @classmethod
+    def get_value(cls, name, default=None):
+        row = cls.query.get(name)
+        return default if row is None else row.value
+
+    @classmethod
+    def set_value(cls, name, value):
+        row = cls.query.get(name)
+        if row is None:
+            row = cls(name=name)
+            db.session.add(row)
+        row.value = value
+        row.updated = datetime.utcnow()
+
+
+# Word counts over the proposals sponsored by each mandate, for the word
+# cloud on person pages. It's derived data, kept up to date by triggers on
+# `ocr_text` and `sponsorship` (`MANDATE_WORD_TRIGGER_DDL`), so bulk loads
+# and deletes that bypass the ORM are counted too. It's a plain table that
+# `dump_tables` skips; `db rebuild_mandate_words` recomputes it.
+mandate_word = db.Table('mandate_word',
+    db.Column('mandate_id', UUID, db.ForeignKey('mandate.id'),
+              primary_key=True),
+    db.Column('word', db.Text, primary_key=True),
+    db.Column('count', db.Integer, nullable=False),
+    db.Index('mandate_word_mandate_id_count_index', 'mandate_id', 'count'),
+)
+
+REBUILD_MANDATE_WORDS_SQL = r"""
+WITH proposal_words AS (
+    SELECT ocr_text.id AS proposal_id,
+           unnest(regexp_split_to_array(lower(text), '\M\W*\m')) AS word
+    FROM ocr_text
+    WHERE ocr_text.parent = 'proposal'
+),
+proposal_word_counts AS (
+    SELECT proposal_id, word, count(*) AS n FROM proposal_words
+    WHERE char_length(word) > 4
+    GROUP BY proposal_id, word
+)
+INSERT INTO mandate_word (mandate_id, word, count)
+SELECT sponsorship.mandate_id, proposal_word_counts.word,
+       sum(proposal_word_counts.n)
+FROM proposal_word_counts
+JOIN sponsorship
+  ON sponsorship.proposal_id = proposal_word_counts.proposal_id
+GROUP BY sponsorship.mandate_id, proposal_word_counts.word
+"""
+
+# add (`sign` = 1) or subtract (`sign` = -1) the words of a proposal text
+# to the counts of one sponsor; an update-then-insert, there's no upsert
+# before PostgreSQL 9.5
+MANDATE_WORD_ADD_DDL = r"""
+CREATE OR REPLACE FUNCTION mandate_word_add(
+        proposal_text text, mandate uuid, sign integer) RETURNS void AS $$
+BEGIN
+    WITH word_counts AS (
+        SELECT word, sign * count(*) AS n
+        FROM unnest(regexp_split_to_array(lower(proposal_text), '\M\W*\m'))
+            AS word
+        WHERE char_length(word) > 4
+        GROUP BY word
+    ),
+    updated AS (
+        UPDATE mandate_word SET count = mandate_word.count + word_counts.n
+        FROM word_counts
+        WHERE mandate_word.mandate_id = mandate
+          AND mandate_word.word = word_counts.word
+        RETURNING mandate_word.word
+    )
+    INSERT INTO mandate_word (mandate_id, word, count)
+    SELECT mandate, word, n FROM word_counts
+    WHERE word NOT IN (SELECT word FROM updated);
+    IF sign < 0 THEN
+        DELETE FROM mandate_word WHERE mandate_id = mandate AND count <= 0;
+    END IF;
+END
+$$ LANGUAGE plpgsql
+"""
+
+MANDATE_WORD_TRIGGER_DDL = {
+    OcrText: [
+        MANDATE_WORD_ADD_DDL,
+        """
+        CREATE OR REPLACE FUNCTION mandate_word_ocr_text_trigger()
+                RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.parent = 'proposal' THEN
+                PERFORM mandate_word_add(OLD.text, mandate_id, -1)
+                FROM sponsorship WHERE proposal_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.parent = 'proposal' THEN
+                PERFORM mandate_word_add(NEW.text, mandate_id, 1)
+                FROM sponsorship WHERE proposal_id = NEW.id;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "CREATE TRIGGER ocr_text_mandate_word_update "
+            "AFTER INSERT OR UPDATE OF text, parent OR DELETE ON ocr_text "
+            "FOR EACH ROW EXECUTE PROCEDURE mandate_word_ocr_text_trigger()",
+    ],
+    Sponsorship: [
+        MANDATE_WORD_ADD_DDL,
+        """
+        CREATE OR REPLACE FUNCTION mandate_word_sponsorship_trigger()
+                RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM mandate_word_add(text, OLD.mandate_id, -1)
+                FROM ocr_text
+                WHERE id = OLD.proposal_id AND parent = 'proposal';
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM mandate_word_add(text, NEW.mandate_id, 1)
+                FROM ocr_text
+                WHERE id = NEW.proposal_id AND parent = 'proposal';
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "CREATE TRIGGER sponsorship_mandate_word_update "
+            "AFTER INSERT OR UPDATE OF proposal_id, mandate_id OR DELETE "
+            "ON sponsorship FOR EACH ROW "
+            "EXECUTE PROCEDURE mandate_word_sponsorship_trigger()",
+    ],
+}
+
+for _model, _ddl_list in MANDATE_WORD_TRIGGER_DDL.items():
+    for _ddl in _ddl_list:
+        event.listen(_model.__table__, 'after_create',
+                     DDL(_ddl).execute_if(dialect='postgresql'))
+
+
+# Full-text search: each of these columns has a `<column>_tsv` companion
+# that a trigger keeps up to date, with a GIN index. They're not mapped,
+# queries refer to them by name (see `DataAccess.search`).
+FULLTEXT_COLUMNS = [
+    (Person, 'romania_curata'),
+    (Transcript, 'text'),
+    (OcrText, 'text'),
+    (Question, 'title'),
+]
+
+FULLTEXT_DDL = [
+    "ALTER TABLE {table} ADD COLUMN {column}_tsv tsvector",
+    "CREATE INDEX {table}_{column}_tsv_index ON {table} "
+        "USING gin({column}_tsv)",
+    "CREATE TRIGGER {table}_{column}_tsv_update "
+        "BEFORE INSERT OR UPDATE OF {column} ON {table} FOR EACH ROW "
+        "EXECUTE PROCEDURE tsvector_update_trigger("
+        "{column}_tsv, 'pg_catalog.romanian', {column})",
+]
+
+for _model, _column in FULLTEXT_COLUMNS:
+    for _ddl in FULLTEXT_DDL:
+        event.listen(
+            _model.__table__, 'after_create',
+            DDL(_ddl.format(table=_model.__tablename__, column=_column))
+                .execute_if(dialect='postgresql'),
+        )
+
+
 class Text(db.Model):
     id = db.Column(UUID, primary_key=True, default=random_uuid)
     ns = db.Column(db.Text, nullable=False)
@@ -643,8 +819,13 @@ class MandateLookup:
     """ Find the right person+mandate based on name, year and cdep_number """
 
     def __init__(self):
-        self.cdep_mandate = {(p.year, p.cdep_number): p
-                             for p in Mandate.query.join(Mandate.person)}
+        # load `person` too, scrapers expunge the session between batches
+        query = (
+            Mandate.query
+            .join(Mandate.person)
+            .options(contains_eager(Mandate.person))
+        )
+        self.cdep_mandate = {(p.year, p.cdep_number): p for p in query}
 
     def name_bits(self, name):
         return set(fix_local_chars(name).replace('-', ' ').split())
@@ -658,25 +839,51 @@ class MandateLookup:
 
 
 class NameSearch:
+    """ Find people by the words of their name. `person_list` can hold
+    anything with a `name` attribute; results keep its order. Name words are
+    kept in an inverted index, and in a sorted list for prefix lookups. """
 
     def __init__(self, person_list=None):
         if person_list is None:
             person_list = Person.query.all()
-        self.by_name = [
-            (self.explode(person.name), person)
-            for person in person_list
-        ]
+        self.person_list = list(person_list)
+        self.by_word = defaultdict(set)
+        for idx, person in enumerate(self.person_list):
+            for word in self.explode(person.name):
+                self.by_word[word].add(idx)
+        self.words = sorted(self.by_word)
 
     def explode(self, name):
         return frozenset(normalize(name).replace('-', ' ').split())
 
+    def _people(self, postings):
+        if not postings:
+            return list(self.person_list)
+        found = set.intersection(*postings)
+        return [self.person_list[idx] for idx in sorted(found)]
+
+    def _prefix_postings(self, prefix):
+        rv = set()
+        idx = bisect_left(self.words, prefix)
+        while idx < len(self.words) and self.words[idx].startswith(prefix):
+            rv.update(self.by_word[self.words[idx]])
+            idx += 1
+        return rv
+
     def find(self, name):
-        exploded_name = self.explode(name)
-        return [
-            person
-            for person_name, person in self.by_name
-            if exploded_name.issubset(person_name)
-        ]
+        """ People whose name contains every word of `name`. """
+        return self._people([
+            self.by_word.get(word, set())
+            for word in self.explode(name)
+        ])
+
+    def find_prefix(self, name):
+        """ People whose name has a word starting with each word of
+        `name`, e.g. "pon vic" finds Ponta Victor-Viorel. """
+        return self._people([
+            self._prefix_postings(word)
+            for word in self.explode(name)
+        ])
 
 
 def init_app(app):
@@ -756,7 +963,8 @@ def drop(names):
 def get_model_map():
     reg = db.Model._decl_class_registry
     models = [reg[k] for k in reg if not k.startswith('_')]
-    return {m.__table__.name: m for m in models}
+    # scraper checkpoints are the state of local runs, not data to back up
+    return {m.__table__.name: m for m in models if m is not ScraperState}
 
 
 class TableLoader:
@@ -843,13 +1051,21 @@ def load(name, include_columns=None, create=True, remove=False,
     else:
         filter_record = lambda r: r
     loader = TableLoader(name)
-    patcher = TablePatcher(loader.model, db.session, key_columns=['id'])
+    patcher = TablePatcher(loader.model, db.session, key_columns=['id'],
+                           bulk_insert=True)
     records = (filter_record(loader.decode_dict(flask.json.loads(line)))
                for line in _file)
     patcher.update(records, create=create, remove=remove)
     db.session.commit()
 
 
+@db_manager.command
+def rebuild_mandate_words():
+    db.session.execute(mandate_word.delete())
+    db.session.execute(REBUILD_MANDATE_WORDS_SQL)
+    db.session.commit()
+
+
 @db_manager.command
 def dump_tables(folder_path=None, xclude=None):
     if folder_path is None:
@@ -1,8 +1,13 @@
 import re
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, Counter
+from difflib import SequenceMatcher
+from itertools import permutations
+from functools import lru_cache
 from mptracker.placenames import get_county_data, get_minority_names
 
 Token = namedtuple('Token', ['text', 'start', 'end'])
+NormalizedToken = namedtuple('NormalizedToken',
+                             ['text', 'start', 'end', 'norm', 'words', 'stems'])
 ANY_PUNCTUATION = r'[.,;!?\-()]*'
 word_pattern = re.compile(r'\b' + ANY_PUNCTUATION +
                           r'(?P<word>\S+?)' +
@@ -18,12 +23,11 @@ name_normalization_map = [
     ('î', 'i'),
     ('ö', 'o')
 ]
+name_normalization_table = str.maketrans(dict(name_normalization_map))
 
 
 def normalize_to_ascii(txt):
-    for ch, new_ch in name_normalization_map:
-        txt = txt.replace(ch, new_ch)
-    return txt
+    return txt.translate(name_normalization_table)
 
 
 stop_words = set([
@@ -75,8 +79,7 @@ def simple_stem(word):
 
 
 def normalize(name, stem=False):
-    name = name.lower()
-    name = normalize_to_ascii(name)
+    name = name.lower().translate(name_normalization_table)
     if stem:
         name = ' '.join(simple_stem(w) for w in name.split())
     return name
@@ -93,6 +96,23 @@ def tokenize(text):
         yield Token(word, match.start('word'), match.end('word'))
 
 
+def tokenize_normalized(text):
+    """ Like `tokenize`, but each token also carries its normalized text,
+    the words of that text (a hyphenated token has several) and their stems.
+    They are computed once for each distinct token text. """
+    forms = {}
+    for token in tokenize(text):
+        form = forms.get(token.text)
+        if form is None:
+            norm = token.text.lower().translate(name_normalization_table)
+            form = forms[token.text] = (
+                norm,
+                norm.split(' '),
+                [simple_stem(w) for w in norm.split()],
+            )
+        yield NormalizedToken(token.text, token.start, token.end, *form)
+
+
 def join_tokens(tokens):
     text = ' '.join(t.text for t in tokens)
     return Token(text, tokens[0].start, tokens[-1].end)
@@ -110,69 +130,274 @@ def prepare_vocabulary(name_list):
     return sorted(out.items())
 
 
-def match_names(text, name_list, phrase_list, mp_info={}):
+class NameMatcher:
+    """ Finds the names of `name_list` and `phrase_list` in a text. The
+    vocabularies are compiled once into tries over normalized words, so
+    a matcher can be reused for many texts, and each text is scanned in
+    a single pass. """
+
     MP_TITLE_LOOKBEHIND_TOKENS = 7
 
-    name_vocabulary = prepare_vocabulary(name_list + phrase_list)
-    phrase_vocabulary = prepare_vocabulary(phrase_list)
-
-    matches = []
-    tokens = list(tokenize(text))
-    for idx in range(len(tokens)):
-        token_matches = []
-        first = tokens[idx].text[0]
-        vocabulary = name_vocabulary if first.isupper() else phrase_vocabulary
-        for word_count, counted_name_list in vocabulary:
-            if idx + word_count > len(tokens):
+    def __init__(self, name_list, phrase_list):
+        self.name_trie = self.compile(name_list + phrase_list)
+        self.phrase_trie = self.compile(phrase_list)
+
+    def compile(self, name_list):
+        # each trie node is a dict of word -> child node; the `None` key of
+        # a node holds the (word count, name) that ends there. Names are
+        # split on single spaces, the same way a window of tokens is joined
+        # before being compared in `prepare_vocabulary` terms.
+        trie = {}
+        for word_count, counted_name_list in prepare_vocabulary(name_list):
+            for norm_name, name in counted_name_list.items():
+                node = trie
+                for word in norm_name.split(' '):
+                    node = node.setdefault(word, {})
+                node[None] = (word_count, name)
+        return trie
+
+    def _walk(self, trie, token_words, idx):
+        """ Yield `(word_count, name)` for the names in `trie` that start at
+        token `idx` and end on a token boundary. """
+        node = trie
+        for n in range(idx, len(token_words)):
+            for word in token_words[n]:
+                node = node.get(word)
+                if node is None:
+                    return
+            end = node.get(None)
+            if end is not None and end[0] == n - idx + 1:
+                yield end
+
+    def match(self, text, mp_info={}):
+        matches = []
+        tokens = list(tokenize_normalized(text))
+        plain_words = [t.words for t in tokens]
+        stem_words = [t.stems for t in tokens]
+
+        county_name = normalize(mp_info.get('county_name') or '')
+        mp_name_bits = [t.text for t in tokenize(mp_info.get('name', ''))]
+        signature_bits = set(normalize(word) for word in
+                             mp_name_bits + signature_stop_words)
+
+        for idx in range(len(tokens)):
+            first = tokens[idx].text[0]
+            trie = self.name_trie if first.isupper() else self.phrase_trie
+
+            found = []
+            for stem, token_words in enumerate([plain_words, stem_words]):
+                for word_count, name in self._walk(trie, token_words, idx):
+                    found.append((word_count, stem, name))
+            if not found:
                 continue
-            token_window = tokens[idx : idx + word_count]
-            token = join_tokens(token_window)
-
-            for stem in [False, True]:
-                norm_token = normalize(token.text, stem=stem)
-                if norm_token in counted_name_list:
-                    distance = 1.0
-                    token_matches.append({
-                        'distance': distance,
-                        'name': counted_name_list[norm_token],
-                        'token': token,
-                    })
-
-        if not token_matches:
-            continue
 
-        token_matches.sort(key=lambda m: len(m['name']))
-        top_match = token_matches[-1]
+            # same pick as a stable sort by name length, with candidates in
+            # order of word count, plain before stemmed
+            found.sort(key=lambda f: (len(f[2]), f[0], f[1]))
+            (word_count, stem, name) = found[-1]
+            top_match = {
+                'distance': 1.0,
+                'name': name,
+                'token': join_tokens(tokens[idx : idx + word_count]),
+            }
 
-        if (normalize(top_match['name']) ==
-                normalize(mp_info.get('county_name') or '')):
-            mp_name_bits = [t.text for t in tokenize(mp_info.get('name', ''))]
-            signature_bits = set(normalize(word) for word in
-                                 mp_name_bits + signature_stop_words)
+            if normalize(name) == county_name:
+                start = max(0, idx - self.MP_TITLE_LOOKBEHIND_TOKENS)
+                recent_text_bits = set(t.norm for t in tokens[start:idx])
 
-            recent_tokens = tokens[:idx][- MP_TITLE_LOOKBEHIND_TOKENS:]
-            recent_text_bits = set(normalize(t.text) for t in recent_tokens)
+                if len(signature_bits & recent_text_bits) > 0:
+                    continue
 
-            if len(signature_bits & recent_text_bits) > 0:
-                continue
+            matches.append(top_match)
 
-        matches.append(top_match)
+        return matches
 
-    return matches
+
+def match_names(text, name_list, phrase_list, mp_info={}):
+    return NameMatcher(name_list, phrase_list).match(text, mp_info=mp_info)
+
+
+class AmbiguousName(Exception):
+    """ More than one indexed name matches a name about equally well. """
+
+    def __init__(self, name, values):
+        super().__init__("%r matches each of %r" % (name, values))
+        self.name = name
+        self.values = values
+
+
+class FuzzyNameIndex:
+    """ Fuzzy lookup of person names that may be misspelled, lack
+    diacritics or have their words in another order. Names are indexed by
+    their normalized words and the character trigrams of those words; a
+    lookup only scores the names that share a word, or most of their
+    trigrams, with the query. The score is the best `SequenceMatcher` ratio
+    (0-100) over orderings of the query's words. """
+
+    NGRAM_SIZE = 3
+    MIN_NGRAM_OVERLAP = .5
+    MAX_PERMUTED_WORDS = 6
+    # `find` refuses a match if another name scores this close to it
+    AMBIGUITY_MARGIN = 6
+
+    def __init__(self, items=()):
+        self.entries = []
+        self.by_words = defaultdict(list)
+        self.by_word = defaultdict(list)
+        self.by_ngram = defaultdict(list)
+        self.by_value = defaultdict(list)
+        for name, value in items:
+            self.add(name, value)
+
+    def split(self, name):
+        return normalize(name).split()
+
+    def ngrams(self, words):
+        n = self.NGRAM_SIZE
+        rv = set()
+        for word in words:
+            padded = ' %s ' % word
+            rv.update(padded[i : i + n] for i in range(len(padded) - n + 1))
+        return rv
+
+    def add(self, name, value):
+        words = self.split(name)
+        idx = len(self.entries)
+        self.entries.append((' '.join(words), value))
+        self.by_words[' '.join(sorted(words))].append(idx)
+        self.by_value[value].append(idx)
+        for word in set(words):
+            self.by_word[word].append(idx)
+        for ngram in self.ngrams(words):
+            self.by_ngram[ngram].append(idx)
+
+    def discard(self, value):
+        """ Stop returning `value` from lookups. """
+        for idx in self.by_value.pop(value, ()):
+            self.entries[idx] = (self.entries[idx][0], None)
+
+    def candidates(self, words):
+        found = set()
+        for word in words:
+            found.update(self.by_word.get(word, ()))
+
+        query_ngrams = self.ngrams(words)
+        overlap = Counter()
+        for ngram in query_ngrams:
+            overlap.update(self.by_ngram.get(ngram, ()))
+        min_overlap = len(query_ngrams) * self.MIN_NGRAM_OVERLAP
+        found.update(idx for idx, n in overlap.items() if n >= min_overlap)
+
+        return sorted(found)
+
+    def find_all_words(self, name):
+        """ Values of the names that contain every word of `name`. """
+        postings = [set(self.by_word.get(w, ())) for w in set(self.split(name))]
+        if not postings:
+            return []
+        found = set.intersection(*postings)
+        return [self.entries[idx][1] for idx in sorted(found)
+                if self.entries[idx][1] is not None]
+
+    def exact_matches(self, name):
+        """ Values of the names with the same normalized words as `name`,
+        in any order. """
+        rv = []
+        for idx in self.by_words.get(' '.join(sorted(self.split(name))), ()):
+            value = self.entries[idx][1]
+            if value is not None and value not in rv:
+                rv.append(value)
+        return rv
+
+    def matches(self, name, cutoff=0, margin=0):
+        """ Return `(score, value)` pairs, best first, for the values whose
+        names score within `margin` of the best score, if that is above
+        `cutoff`. The runners-up may score below `cutoff`. Each value
+        appears once, with the score of its best name. """
+        words = self.split(name)
+        if len(words) <= self.MAX_PERMUTED_WORDS:
+            orderings = [' '.join(p) for p in permutations(words)]
+        else:
+            orderings = [' '.join(words)]
+
+        best_score = cutoff
+        floor = cutoff - margin
+        score_by_value = {}
+        matcher = SequenceMatcher(None, '', '')
+        for idx in self.candidates(words):
+            (norm_name, value) = self.entries[idx]
+            if value is None:
+                continue
+            matcher.set_seq2(norm_name)
+            matcher.set_seq1(orderings[0])
+            # all orderings have the same characters, so this bound holds
+            # for every one of them
+            if matcher.quick_ratio() * 100 <= floor:
+                continue
+            for text in orderings:
+                matcher.set_seq1(text)
+                score = matcher.ratio() * 100
+                if score <= max(floor, score_by_value.get(value, 0)):
+                    continue
+                score_by_value[value] = score
+                if score > best_score:
+                    best_score = score
+                    floor = max(floor, score - margin)
+
+        if best_score <= cutoff:
+            return []
+        rv = [(score, value) for value, score in score_by_value.items()
+              if score >= best_score - margin]
+        rv.sort(key=lambda m: -m[0])
+        return rv
+
+    def best_match(self, name, cutoff=0):
+        """ Return `(score, value)` for the best name scoring above
+        `cutoff`, or `(cutoff, None)` if there is none. """
+        rv = self.matches(name, cutoff)
+        return rv[0] if rv else (cutoff, None)
+
+    def find(self, name, cutoff=93):
+        """ Return the value of the name that matches `name` exactly once
+        normalized, or else of the best fuzzy match scoring above `cutoff`,
+        or None. Raise `AmbiguousName` if several names match exactly, or
+        if another name scores within `AMBIGUITY_MARGIN` of the best. """
+        values = self.exact_matches(name)
+        if not values:
+            values = [value for (score, value) in
+                      self.matches(name, cutoff, self.AMBIGUITY_MARGIN)]
+        if len(values) > 1:
+            raise AmbiguousName(name, values)
+        return values[0] if values else None
+
+
+@lru_cache(100)
+def get_county_matcher(geonames_code):
+    county_data = get_county_data(geonames_code)
+    return NameMatcher(county_data['place_names'], other_phrases)
+
+
+@lru_cache()
+def get_minority_matcher():
+    return NameMatcher(get_minority_names()['search_names'], other_phrases)
 
 
 def match_text_for_mandate(mandate, text):
     mp_info = {'name': mandate.person.name}
 
     if mandate.minority:
-        local_names = get_minority_names()['search_names']
+        matcher = get_minority_matcher()
 
     else:
         county_data = get_county_data(mandate.county.geonames_code)
-        local_names = county_data['place_names']
+        matcher = get_county_matcher(mandate.county.geonames_code)
         mp_info['county_name'] = county_data['name']
 
-    matches = match_names(text, local_names, other_phrases, mp_info=mp_info)
+    return match_text(matcher, text, mp_info)
+
+
+def match_text(matcher, text, mp_info={}):
+    matches = matcher.match(text, mp_info=mp_info)
     top_matches = sorted(matches,
                          key=lambda m: m['distance'],
                          reverse=True)[:10]
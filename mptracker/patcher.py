@@ -1,6 +1,11 @@
-from collections import namedtuple
+from collections import namedtuple, defaultdict
 from contextlib import contextmanager
+import hashlib
 import logging
+import json
+from sqlalchemy import (inspect, exists, select, bindparam,
+                        Table, MetaData, Column)
+from mptracker.dbutil import can_copy, copy_rows
 
 
 class RowNotFound(Exception):
@@ -9,6 +14,33 @@ class RowNotFound(Exception):
 
 AddResult = namedtuple('AddResult', ['row', 'is_new', 'is_changed'])
 
+# placeholder in `TablePatcher.rows_by_key` for a row that was written with
+# `bulk_insert` and is only in the database, not in the session
+WRITTEN = object()
+
+# what `TablePatcher.rows_by_key` holds for existing rows when preloading
+# with a `fingerprint` column
+RowFingerprint = namedtuple('RowFingerprint', ['id', 'fingerprint'])
+
+
+def insert_rows(connection, table, column_keys, rows, batch_size=1000):
+    """ Insert `rows`, dicts with the same `column_keys`, into `table`.
+    Uses COPY on PostgreSQL and multi-row INSERT statements elsewhere. """
+    columns = [table.c[k] for k in column_keys]
+    dialect = connection.dialect
+    if dialect.name == 'postgresql' and all(can_copy(c) for c in columns):
+        processors = [c.type.bind_processor(dialect) for c in columns]
+        copy_rows(connection, table, columns, (
+            [p(v[k]) if p else v[k] for k, p in zip(column_keys, processors)]
+            for v in rows
+        ))
+
+    else:
+        # stay well below sqlite's limit of 999 bound parameters
+        chunk_size = max(1, min(batch_size, 900 // len(columns)))
+        for n in range(0, len(rows), chunk_size):
+            connection.execute(table.insert().values(rows[n:n + chunk_size]))
+
 
 class TablePatcher:
 
@@ -16,7 +48,15 @@ class TablePatcher:
     if not logger.level:
         logger.setLevel(logging.INFO)
 
-    def __init__(self, model, session, key_columns, filter=None):
+    def __init__(self, model, session, key_columns, filter=None,
+                 preload=False, batch_size=1000, bulk_insert=False,
+                 fingerprint=None):
+        """ `filter`: column values, or lists of values, scoping the rows.
+        `preload`: fetch the filtered rows once; keys must be unique in it.
+        `batch_size`: flush pending changes every this many records.
+        `bulk_insert`: implies `preload`; new rows are detached, bulk-written.
+        `fingerprint`: column hashing the last record, to skip unchanged ones.
+        """
         from mptracker.models import random_uuid
         self.random_uuid = random_uuid
         self.model = model
@@ -25,46 +65,179 @@ class TablePatcher:
         self.key_columns = key_columns
         self.seen = set()
         self.filter = filter
+        self.preload = preload or bulk_insert
+        self.batch_size = batch_size
+        self.bulk_insert = bulk_insert
+        self.fingerprint = fingerprint
+        self.rows_by_key = None
+        self.new_rows = []
 
     def _dict_key(self, record):
         return tuple(record.get(k) for k in self.key_columns)
 
+    def _row_key(self, row):
+        return tuple(getattr(row, k) for k in self.key_columns)
+
+    def _load_rows(self):
+        self.flush()
+        if self.fingerprint:
+            query = self.session.query(
+                self.model.id,
+                getattr(self.model, self.fingerprint),
+                *[getattr(self.model, k) for k in self.key_columns]
+            )
+        else:
+            query = self.session.query(self.model)
+        for clause in self._filter_clauses():
+            query = query.filter(clause)
+
+        if self.fingerprint:
+            self.rows_by_key = {tuple(row[2:]): RowFingerprint(*row[:2])
+                                for row in query}
+        else:
+            self.rows_by_key = {self._row_key(row): row for row in query}
+        self.logger.debug("Preloaded %d %s rows",
+                          len(self.rows_by_key), self.table_name)
+
+    def _filter_clauses(self):
+        for name, value in (self.filter or {}).items():
+            column = getattr(self.model, name)
+            if isinstance(value, (list, tuple, set)):
+                yield column.in_(value)
+            else:
+                yield column == value
+
     def _get_row_for_key(self, key):
+        if self.preload:
+            if self.rows_by_key is None:
+                self._load_rows()
+            row = self.rows_by_key.get(key)
+            if row is WRITTEN:
+                row = self.rows_by_key[key] = self._query_row(key)
+            return row
+
         self.session.flush()
+        return self._query_row(key)
+
+    def _query_row(self, key):
         return (
             self.model.query
             .filter_by(**dict(zip(self.key_columns, key)))
             .first()
         )
 
+    def _write_new_rows(self):
+        if not self.new_rows:
+            return
+
+        connection = self.session.connection()
+
+        # group rows by the columns they set, so unset columns keep their
+        # database default like they would through the ORM
+        groups = defaultdict(list)
+        for row in self.new_rows:
+            values = {}
+            for prop in inspect(self.model).column_attrs:
+                column = prop.columns[0]
+                if prop.key in row.__dict__:
+                    values[column.key] = getattr(row, prop.key)
+                elif column.default is not None:
+                    values[column.key] = self._default_value(column.default)
+            groups[tuple(sorted(values))].append(values)
+
+        for column_keys, group in groups.items():
+            insert_rows(connection, self.model.__table__, column_keys, group,
+                        self.batch_size)
+
+        for row in self.new_rows:
+            self.rows_by_key[self._row_key(row)] = WRITTEN
+        self.logger.debug("Bulk inserted %d %s rows",
+                          len(self.new_rows), self.table_name)
+        self.new_rows = []
+
+    def _default_value(self, default):
+        if default.is_callable:
+            return default.arg(None)
+        return default.arg
+
+    def flush(self):
+        """ Write pending changes, ORM rows first: rows written by
+        `insert_rows`, here or in a `GroupPatcher`, may reference them. """
+        self.session.flush()
+        self._write_new_rows()
+
     def _mark_seen(self, row_id):
         self.seen.add(row_id)
 
-    def ids_to_delete(self):
-        self.session.flush()
-        query = self.session.query(self.model.id)
-        if self.filter:
-            query = query.filter_by(**self.filter)
-        for row in query:
-            row_id = row[0]
-            if row_id not in self.seen:
-                yield row_id
+    def delete_unseen(self):
+        """ Delete the rows matching `filter` that were not seen, and
+        return their number. The seen ids are staged in a temporary table
+        and removed with a single anti-join, so the table's ids never
+        leave the database. """
+        self.flush()
+        connection = self.session.connection()
+        table = self.model.__table__
+        seen_table = Table(
+            'patcher_seen_%s' % self.table_name, MetaData(),
+            Column('id', table.c.id.type, primary_key=True),
+            prefixes=['TEMPORARY'],
+        )
+        seen_table.create(connection)
+        try:
+            if connection.dialect.name == 'postgresql':
+                copy_rows(connection, seen_table, [seen_table.c.id],
+                          ([row_id] for row_id in self.seen))
+            elif self.seen:
+                connection.execute(seen_table.insert(),
+                                   [{'id': row_id} for row_id in self.seen])
+
+            delete = table.delete().where(
+                ~exists().where(seen_table.c.id == table.c.id))
+            for clause in self._filter_clauses():
+                delete = delete.where(clause)
+            return connection.execute(delete).rowcount
+
+        finally:
+            seen_table.drop(connection)
+
+    def _record_fingerprint(self, record):
+        data = json.dumps(record, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
 
     def add(self, record, create=True):
         key = self._dict_key(record)
         row = self._get_row_for_key(key)
         is_new = is_changed = False
 
+        fingerprint = None
+        if self.fingerprint:
+            fingerprint = self._record_fingerprint(record)
+            if isinstance(row, RowFingerprint):
+                if row.fingerprint == fingerprint:
+                    self._mark_seen(row.id)
+                    return AddResult(row, is_new, is_changed)
+                row = self.session.query(self.model).get(row.id)
+                self.rows_by_key[key] = row
+
         if row is None:
             if create:
                 row = self.model(id=record.get('id') or self.random_uuid())
                 self.logger.info("Adding %s %r", self.table_name, key)
                 is_new = is_changed = True
-                self.session.add(row)
+                if self.bulk_insert:
+                    self.new_rows.append(row)
+                else:
+                    self.session.add(row)
+                if self.rows_by_key is not None:
+                    self.rows_by_key[key] = row
 
             else:
                 raise RowNotFound("Could not find row with key=%r" % key)
 
+        elif (fingerprint is not None and
+              getattr(row, self.fingerprint) == fingerprint):
+            pass
+
         else:
             changes = []
             for k in record:
@@ -86,6 +259,10 @@ class TablePatcher:
             for k in record:
                 setattr(row, k, record[k])
 
+        if (fingerprint is not None and
+                getattr(row, self.fingerprint) != fingerprint):
+            setattr(row, self.fingerprint, fingerprint)
+
         if row.id is None:
             self.session.flush()
         self._mark_seen(row.id)
@@ -96,13 +273,15 @@ class TablePatcher:
     def process(self, autoflush=None, remove=False):
         counters = {'n_add': 0, 'n_update': 0,
                     'n_remove': 0, 'n_ok': 0, 'total': 0}
+        if autoflush is None and self.preload:
+            autoflush = self.batch_size
 
         def add(record, create=True):
             result = self.add(record, create=create)
 
-            counters['total'] += 0
+            counters['total'] += 1
             if autoflush and counters['total'] % autoflush == 0:
-                self.session.flush()
+                self.flush()
 
             if result.is_new:
                 counters['n_add'] += 1
@@ -116,20 +295,15 @@ class TablePatcher:
             return result
 
         self.seen.clear()
+        self.rows_by_key = None
+        self.new_rows = []
 
         yield add
 
         if remove:
-            unseen = list(self.ids_to_delete())
-            if unseen:
-                unseen_items = (
-                    self.model.query
-                    .filter(self.model.id.in_(unseen))
-                )
-                unseen_items.delete(synchronize_session=False)
-                counters['n_remove'] += len(unseen)
+            counters['n_remove'] += self.delete_unseen()
 
-        self.session.flush()
+        self.flush()
         self.logger.info(
             "%s: created %d, updated %d, removed %d, found ok %d.",
             self.table_name,
@@ -138,6 +312,95 @@ class TablePatcher:
         )
 
     def update(self, data, create=True, remove=False):
-        with self.process(autoflush=1000, remove=remove) as add:
+        with self.process(autoflush=self.batch_size, remove=remove) as add:
             for record in data:
                 add(record, create=create)
+
+
+class GroupPatcher:
+    """ Patch a table one group of rows at a time, e.g. the votes of a
+    voting session, given as a list of keys and a list of values per
+    column. New rows are inserted in bulk, changed ones updated in one
+    executemany, and missing ones left alone. Writes bypass the ORM, so
+    objects loaded in the session are not refreshed. """
+
+    logger = logging.getLogger(__name__ + '.GroupPatcher')
+    if not logger.level:
+        logger.setLevel(logging.INFO)
+
+    def __init__(self, model, session, group_column, key_column,
+                 batch_size=1000):
+        from mptracker.models import random_uuid
+        self.random_uuid = random_uuid
+        self.model = model
+        self.table_name = model.__table__.name
+        self.session = session
+        self.group_column = group_column
+        self.key_column = key_column
+        self.batch_size = batch_size
+        self.counters = {'n_add': 0, 'n_update': 0, 'n_ok': 0}
+
+    def patch(self, group, keys, values):
+        table = self.model.__table__
+        value_columns = sorted(values)
+        records = {
+            key: tuple(row_values)
+            for key, *row_values in zip(keys, *[values[c]
+                                                for c in value_columns])
+        }
+
+        self.session.flush()
+        connection = self.session.connection()
+        query = (
+            select([table.c.id, table.c[self.key_column]] +
+                   [table.c[c] for c in value_columns])
+            .where(table.c[self.group_column] == group)
+        )
+        existing = {}
+        for (row_id, key, *row_values) in connection.execute(query).fetchall():
+            existing[key] = (row_id, tuple(row_values))
+
+        new_rows = []
+        changed_rows = []
+        for key, record in records.items():
+            if key not in existing:
+                row = dict(zip(value_columns, record))
+                row.update({
+                    'id': self.random_uuid(),
+                    self.group_column: group,
+                    self.key_column: key,
+                })
+                new_rows.append(row)
+
+            elif existing[key][1] != record:
+                # bind names can't be column names in an UPDATE
+                row = {'_' + c: v for c, v in zip(value_columns, record)}
+                row['_id'] = existing[key][0]
+                changed_rows.append(row)
+
+        if new_rows:
+            insert_rows(connection, table, sorted(new_rows[0]), new_rows,
+                        self.batch_size)
+
+        if changed_rows:
+            update = (
+                table.update()
+                .where(table.c.id == bindparam('_id'))
+                .values({c: bindparam('_' + c) for c in value_columns})
+            )
+            connection.execute(update, changed_rows)
+
+        n_ok = len(records) - len(new_rows) - len(changed_rows)
+        self.counters['n_add'] += len(new_rows)
+        self.counters['n_update'] += len(changed_rows)
+        self.counters['n_ok'] += n_ok
+        self.logger.debug("%s %r: created %d, updated %d, found ok %d.",
+                          self.table_name, group, len(new_rows),
+                          len(changed_rows), n_ok)
+
+    def log_counters(self):
+        self.logger.info(
+            "%s: created %d, updated %d, found ok %d.",
+            self.table_name, self.counters['n_add'],
+            self.counters['n_update'], self.counters['n_ok'],
+        )
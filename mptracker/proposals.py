@@ -3,7 +3,9 @@ import logging
 import flask
 from flask.ext.script import Manager
 from flask.ext.rq import job
-from mptracker.common import ocr_url, parse_date
+from sqlalchemy import exists, and_, or_
+from mptracker.common import ocr_url, parse_date, enqueue_ids
+from mptracker.dbutil import iter_id_chunks
 from mptracker.nlp import match_text_for_mandate
 
 logger = logging.getLogger(__name__)
@@ -71,10 +73,13 @@ def relevant():
 @job
 def ocr_proposal(proposal_id, autoanalyze=False):
     proposal = models.Proposal.query.get(proposal_id)
-    pages = ocr_url(proposal.pdf_url)
+    stats = {}
+    pages = ocr_url(proposal.pdf_url, stats=stats)
     proposal.text = '\n\n'.join(pages)
+    models.Meta.get_or_create(proposal.id, 'ocr').value = stats
     models.db.session.commit()
-    logger.info("done OCR for %s (%d pages)", proposal, len(pages))
+    logger.info("done OCR for %s (%d pages, methods %r)",
+                proposal, len(pages), stats.get('methods'))
 
     if autoanalyze:
         sponsorships = proposal.sponsorships.all()
@@ -89,23 +94,23 @@ def ocr_proposal(proposal_id, autoanalyze=False):
 
 
 @proposals_manager.command
-def ocr_all(number=None, force=False):
-    n_jobs = n_skip = n_ok = 0
-    for proposal in models.Proposal.query:
-        if not proposal.pdf_url:
-            n_skip += 1
-            continue
-        if proposal.text is not None and not force:
-            n_ok += 1
-            continue
-
-        ocr_proposal.delay(proposal.id)
-
-        n_jobs += 1
-        if number and n_jobs >= int(number):
-            break
-
-    logger.info("enqueued %d jobs, skipped %d, ok %d", n_jobs, n_skip, n_ok)
+def ocr_all(number=None, force=False, chunk_size=1000):
+    Proposal = models.Proposal
+    OcrText = models.OcrText
+    query = (
+        models.db.session.query(Proposal.id)
+        .filter(Proposal.pdf_url != None)
+        .filter(Proposal.pdf_url != '')
+    )
+    if not force:
+        query = query.filter(~exists().where(and_(
+            OcrText.id == Proposal.id,
+            OcrText.text != None,
+        )))
+
+    id_chunks = iter_id_chunks(query, Proposal.id, int(chunk_size))
+    n_jobs = enqueue_ids(ocr_proposal, id_chunks, number)
+    logger.info("enqueued %d jobs", n_jobs)
 
 
 @job
@@ -122,26 +127,34 @@ def analyze_sponsorship(sponsorship_id):
 
 
 @proposals_manager.command
-def analyze_all(number=None, force=False, minority_only=False):
-    n_jobs = n_skip = n_ok = 0
-    text_row_ids = models.OcrText.all_ids_for('proposal')
-    for sponsorship in models.Sponsorship.query:
-        if not force:
-            if sponsorship.match.data is not None:
-                n_ok += 1
-                continue
-        if sponsorship.proposal_id not in text_row_ids:
-            n_skip += 1
-            continue
-        if not sponsorship.mandate.minority:
-            county = sponsorship.mandate.county
-            if (minority_only or
-                county is None or
-                county.geonames_code is None):
-                n_skip += 1
-                continue
-        analyze_sponsorship.delay(sponsorship.id)
-        n_jobs += 1
-        if number and n_jobs >= int(number):
-            break
-    logger.info("enqueued %d jobs, skipped %d, ok %d", n_jobs, n_skip, n_ok)
+def analyze_all(number=None, force=False, minority_only=False,
+                chunk_size=1000):
+    Sponsorship = models.Sponsorship
+    Mandate = models.Mandate
+    OcrText = models.OcrText
+    Match = models.Match
+    query = (
+        models.db.session.query(Sponsorship.id)
+        .join(Mandate, Sponsorship.mandate_id == Mandate.id)
+        .outerjoin(models.County, Mandate.county_id == models.County.id)
+        .filter(exists().where(and_(
+            OcrText.id == Sponsorship.proposal_id,
+            OcrText.parent == 'proposal',
+        )))
+    )
+    if minority_only:
+        query = query.filter(Mandate.minority == True)
+    else:
+        query = query.filter(or_(
+            Mandate.minority == True,
+            models.County.geonames_code != None,
+        ))
+    if not force:
+        query = query.filter(~exists().where(and_(
+            Match.id == Sponsorship.id,
+            Match.data != None,
+        )))
+
+    id_chunks = iter_id_chunks(query, Sponsorship.id, int(chunk_size))
+    n_jobs = enqueue_ids(analyze_sponsorship, id_chunks, number)
+    logger.info("enqueued %d jobs", n_jobs)
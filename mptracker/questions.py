@@ -1,13 +1,19 @@
 import logging
+import multiprocessing
 from collections import defaultdict
-from sqlalchemy import func
+from sqlalchemy import func, bindparam, exists, and_, or_
 from sqlalchemy.orm import joinedload
 import flask
 from flask.ext.script import Manager
 from flask.ext.rq import job
-from mptracker.common import ocr_url, csv_lines, buffer_on_disk
-from mptracker.nlp import match_text_for_mandate
+from mptracker.common import ocr_url, csv_lines, buffer_on_disk, enqueue_ids
+from mptracker.dbutil import iter_id_chunks
+from mptracker.nlp import (match_text_for_mandate, match_text, NameMatcher,
+                           other_phrases)
+from mptracker.placenames import get_county_data, get_minority_names
+from mptracker.patcher import insert_rows
 from mptracker.auth import require_privilege
+from mptracker import models
 
 
 logger = logging.getLogger(__name__)
@@ -22,12 +28,15 @@ questions_manager = Manager()
 def ocr_question(question_id, autoanalyze=False):
     question = models.Question.query.get(question_id)
 
-    pages = ocr_url(question.pdf_url)
+    stats = {}
+    pages = ocr_url(question.pdf_url, stats=stats)
     question.text = '\n\n'.join(pages)
+    models.Meta.get_or_create(question.id, 'ocr').value = stats
 
     models.db.session.add(question)
     models.db.session.commit()
-    logger.info("done OCR for %s (%d pages)", question, len(pages))
+    logger.info("done OCR for %s (%d pages, methods %r)",
+                question, len(pages), stats.get('methods'))
 
     if autoanalyze:
         asked = question.asked.all()
@@ -45,34 +54,35 @@ def ocr_question(question_id, autoanalyze=False):
 def ocr_answer(answer_id):
     answer = models.Answer.query.get(answer_id)
 
-    pages = ocr_url(answer.pdf_url)
+    stats = {}
+    pages = ocr_url(answer.pdf_url, stats=stats)
     answer.text = '\n\n'.join(pages)
+    models.Meta.get_or_create(answer.id, 'ocr').value = stats
 
     models.db.session.add(answer)
     models.db.session.commit()
-    logger.info("done OCR for %s (%d pages)", answer, len(pages))
+    logger.info("done OCR for %s (%d pages, methods %r)",
+                answer, len(pages), stats.get('methods'))
 
 
 @questions_manager.command
-def ocr_all(number=None, force=False):
-    text_row_ids = models.OcrText.all_ids_for('question')
-    def has_text(question):
-        return question.id in text_row_ids
-
-    n_jobs = n_skip = n_ok = 0
+def ocr_all(number=None, force=False, chunk_size=1000):
+    Question = models.Question
+    OcrText = models.OcrText
+    query = (
+        models.db.session.query(Question.id)
+        .filter(Question.pdf_url != None)
+        .filter(Question.pdf_url != '')
+    )
+    if not force:
+        query = query.filter(~exists().where(and_(
+            OcrText.id == Question.id,
+            OcrText.parent == 'question',
+        )))
 
-    for question in models.Question.query:
-        if not question.pdf_url:
-            n_skip += 1
-            continue
-        if has_text(question) and not force:
-            n_ok += 1
-            continue
-        ocr_question.delay(question.id)
-        n_jobs += 1
-        if number and n_jobs >= int(number):
-            break
-    logger.info("enqueued %d jobs, skipped %d, ok %d", n_jobs, n_skip, n_ok)
+    id_chunks = iter_id_chunks(query, Question.id, int(chunk_size))
+    n_jobs = enqueue_ids(ocr_question, id_chunks, number)
+    logger.info("enqueued %d jobs", n_jobs)
 
 
 @job
@@ -88,37 +98,184 @@ def analyze(ask_id):
 
 
 @questions_manager.command
-def analyze_all(number=None, force=False, minority_only=False):
-    text_row_ids = models.OcrText.all_ids_for('question')
-    def has_text(question):
-        return question.id in text_row_ids
-
-    match_row_ids = models.Match.all_ids_for('ask')
-    def has_match(ask):
-        return ask.id in match_row_ids
-
-    n_jobs = n_skip = n_ok = 0
-    for ask in models.Ask.query.join(models.Ask.question):
-        if not force:
-            if has_match(ask):
-                n_ok += 1
-                continue
-        if not has_text(ask.question):
+def analyze_all(number=None, force=False, minority_only=False,
+                chunk_size=1000):
+    Ask = models.Ask
+    Mandate = models.Mandate
+    OcrText = models.OcrText
+    Match = models.Match
+    query = (
+        models.db.session.query(Ask.id)
+        .join(Mandate, Ask.mandate_id == Mandate.id)
+        .outerjoin(models.County, Mandate.county_id == models.County.id)
+        .filter(exists().where(and_(
+            OcrText.id == Ask.question_id,
+            OcrText.parent == 'question',
+        )))
+    )
+    if minority_only:
+        query = query.filter(Mandate.minority == True)
+    else:
+        query = query.filter(or_(
+            Mandate.minority == True,
+            models.County.geonames_code != None,
+        ))
+    if not force:
+        query = query.filter(~exists().where(and_(
+            Match.id == Ask.id,
+            Match.parent == 'ask',
+        )))
+
+    id_chunks = iter_id_chunks(query, Ask.id, int(chunk_size))
+    n_jobs = enqueue_ids(analyze, id_chunks, number)
+    logger.info("enqueued %d jobs", n_jobs)
+
+
+# vocabularies for `analyze_batch` workers, by group (a county's geonames
+# code, or 'minority'), and the matchers compiled from them
+_worker_vocabularies = {}
+_worker_matchers = {}
+
+
+def _init_analysis_worker(vocabularies):
+    _worker_vocabularies.update(vocabularies)
+
+
+def _analyze_chunk(chunk):
+    (group, items) = chunk
+    (names, county_name) = _worker_vocabularies[group]
+    matcher = _worker_matchers.get(group)
+    if matcher is None:
+        matcher = _worker_matchers[group] = NameMatcher(names, other_phrases)
+
+    results = []
+    for ask_id, person_name, text in items:
+        mp_info = {'name': person_name}
+        if county_name is not None:
+            mp_info['county_name'] = county_name
+        results.append((ask_id, match_text(matcher, text, mp_info)))
+    return results
+
+
+def _save_matches(results, existing):
+    """ Write `analyze` results for many asks at once. `existing` maps the
+    ids of asks that already have a Match row to its `manual` flag. """
+    table = models.Match.__table__
+    new_rows = []
+    auto_rows = []
+    manual_rows = []
+    for ask_id, result in results:
+        data = flask.json.dumps(result)
+        score = len(result['top_matches'])
+        if ask_id not in existing:
+            new_rows.append({'id': ask_id, 'parent': 'ask', 'data': data,
+                             'manual': False, 'score': score})
+        elif existing[ask_id]:
+            manual_rows.append({'_id': ask_id, '_data': data})
+        else:
+            auto_rows.append({'_id': ask_id, '_data': data, '_score': score})
+
+    connection = models.db.session.connection()
+    if new_rows:
+        insert_rows(connection, table, sorted(new_rows[0]), new_rows)
+    if auto_rows:
+        connection.execute(
+            table.update()
+            .where(table.c.id == bindparam('_id'))
+            .values(data=bindparam('_data'), score=bindparam('_score')),
+            auto_rows)
+    if manual_rows:
+        connection.execute(
+            table.update()
+            .where(table.c.id == bindparam('_id'))
+            .values(data=bindparam('_data')),
+            manual_rows)
+
+
+@questions_manager.command
+def analyze_batch(force=False, minority_only=False, processes=None,
+                  chunk_size=50, commit_every=1000):
+    """ Like `analyze_all`, but runs the analysis here, in a pool of worker
+    processes, instead of enqueueing a job for each ask. """
+    Ask = models.Ask
+    Mandate = models.Mandate
+    Match = models.Match
+    query = (
+        models.db.session.query(
+            Ask.id, models.Question.title, models.OcrText.text,
+            Mandate.minority, models.County.geonames_code,
+            models.Person.name, Match.id, Match.manual,
+        )
+        .join(models.Question, Ask.question_id == models.Question.id)
+        .join(models.OcrText, models.OcrText.id == models.Question.id)
+        .join(Mandate, Ask.mandate_id == Mandate.id)
+        .join(models.Person, Mandate.person_id == models.Person.id)
+        .outerjoin(models.County, Mandate.county_id == models.County.id)
+        .outerjoin(Match, Match.id == Ask.id)
+        .filter(models.OcrText.text != None)
+    )
+    if not force:
+        query = query.filter(Match.id == None)
+    if minority_only:
+        query = query.filter(Mandate.minority == True)
+
+    items_by_group = defaultdict(list)
+    existing = {}
+    n_skip = 0
+    for (ask_id, title, text, minority, geonames_code, person_name,
+         match_id, manual) in query:
+        if minority:
+            group = 'minority'
+        elif geonames_code is None:
             n_skip += 1
             continue
-        mandate = ask.mandate
-        if not mandate.minority:
-            county = mandate.county
-            if (minority_only or
-                county is None or
-                county.geonames_code is None):
-                n_skip += 1
-                continue
-        analyze.delay(ask.id)
-        n_jobs += 1
-        if number and n_jobs >= int(number):
-            break
-    logger.info("enqueued %d jobs, skipped %d, ok %d", n_jobs, n_skip, n_ok)
+        else:
+            group = geonames_code
+        items_by_group[group].append(
+            (ask_id, person_name, (title or '') + ' ' + text))
+        if match_id is not None:
+            existing[ask_id] = manual
+
+    vocabularies = {}
+    for group in items_by_group:
+        if group == 'minority':
+            vocabularies[group] = (get_minority_names()['search_names'], None)
+        else:
+            county_data = get_county_data(group)
+            vocabularies[group] = (county_data['place_names'],
+                                   county_data['name'])
+
+    chunk_size = int(chunk_size)
+    chunks = [
+        (group, items[n:n + chunk_size])
+        for group, items in items_by_group.items()
+        for n in range(0, len(items), chunk_size)
+    ]
+    n_asks = sum(len(items) for items in items_by_group.values())
+    logger.info("analyzing %d asks in %d groups, skipped %d",
+                n_asks, len(items_by_group), n_skip)
+
+    pool = multiprocessing.Pool(processes and int(processes),
+                                _init_analysis_worker, (vocabularies,))
+    n_done = 0
+    pending = []
+    try:
+        for results in pool.imap_unordered(_analyze_chunk, chunks):
+            pending.extend(results)
+            if len(pending) >= int(commit_every):
+                _save_matches(pending, existing)
+                models.db.session.commit()
+                n_done += len(pending)
+                pending = []
+                logger.info("saved %d/%d", n_done, n_asks)
+
+        _save_matches(pending, existing)
+        models.db.session.commit()
+
+    finally:
+        pool.terminate()
+
+    logger.info("done analyzing %d asks", n_asks)
 
 
 @questions.route('/questions/')
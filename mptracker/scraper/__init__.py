@@ -9,11 +9,12 @@ from flask.ext.script import Manager
 from path import path
 import requests
 from mptracker.scraper.common import get_cached_session, create_session, \
-                                     get_gdrive_csv, parse_interval
+                                     get_gdrive_csv, parse_interval, \
+                                     create_parse_cache
 from mptracker import models
 from mptracker.common import parse_date, model_to_dict, url_args, almost_eq, \
                              generate_slug, iter_file, calculate_md5, temp_dir
-from mptracker.patcher import TablePatcher
+from mptracker.patcher import TablePatcher, GroupPatcher
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -21,6 +22,7 @@ logger.setLevel(logging.INFO)
 scraper_manager = Manager()
 
 ONE_DAY = timedelta(days=1)
+QUESTION_BATCH_SIZE = 100
 
 
 CONTROVERSY_CSV_KEY = '1oCBeyNZc6OxIDJTI25wCeEkIEzkxf6qAwhcE69eDKWY'
@@ -53,6 +55,25 @@ def _get_config_cache_name():
     return flask.current_app.config.get('PAGE_CACHE')
 
 
+def _pool_args(workers, host_rate):
+    return {
+        'max_workers': int(workers),
+        'host_rate': host_rate and float(host_rate),
+    }
+
+
+def _commit_batch(no_commit=False):
+    """ Commit what was scraped so far and empty the session, so long runs
+    don't lose their work to a late error and don't grow in memory.
+    Objects are expunged before the commit, so the ones the caller still
+    holds (e.g. in a `MandateLookup`) keep their loaded attributes. """
+    session = models.db.session
+    session.flush()
+    session.expunge_all()
+    if not no_commit:
+        session.commit()
+
+
 @scraper_manager.command
 def get_questions(
         year='2015',
@@ -60,14 +81,21 @@ def get_questions(
         cache_name=None,
         throttle=None,
         autoanalyze=False,
+        workers=1,
+        host_rate=None,
+        parse_cache=None,
         ):
     from mptracker.scraper.questions import QuestionScraper
     from mptracker.questions import ocr_question, ocr_answer
     from mptracker.policy import calculate_question
 
+    checkpoint_name = 'questions-%s' % year
     if reimport_existing:
+        # resume an interrupted reimport after the last question it saved
+        resume_after = models.ScraperState.get_value(checkpoint_name)
         known_urls = set()
     else:
+        resume_after = None
         url_query = models.db.session.query(models.Question.url)
         known_urls = set(row[0] for row in url_query)
 
@@ -79,7 +107,10 @@ def get_questions(
                                   throttle=throttle and float(throttle),
                                   counters=True)
     questions_scraper = QuestionScraper(session=http_session,
-                                        skip=skip_question)
+                                        skip=skip_question,
+                                        parse_cache=create_parse_cache(
+                                            parse_cache),
+                                        **_pool_args(workers, host_rate))
 
     mandate_lookup = models.MandateLookup()
 
@@ -95,10 +126,11 @@ def get_questions(
 
     changed_questions = []
     changed_answers = []
+    questions = questions_scraper.run(int(year), resume_after=resume_after)
 
     with question_patcher.process() as add, \
          answer_patcher.process() as add_answer:
-        for question in questions_scraper.run(int(year)):
+        for n, question in enumerate(questions, 1):
             person_list = question.pop('person')
             question['addressee'] = '; '.join(question['addressee'])
             answer_data = question.pop('answer', None)
@@ -119,7 +151,8 @@ def get_questions(
                     new_ask_rows += 1
 
             if result.is_changed:
-                changed_questions.append(q)
+                changed_questions.append(
+                    (q.id, q.pdf_url, q.policy_domain_id))
 
             if old_asked:
                 logger.warn("Removing %d old 'ask' records", len(old_asked))
@@ -131,8 +164,16 @@ def get_questions(
                 answer_data['question_id'] = q.id
                 answer_result = add_answer(answer_data)
                 if answer_result.is_changed:
-                    changed_answers.append(answer_result.row)
+                    changed_answers.append(answer_result.row.id)
+
+            if n % QUESTION_BATCH_SIZE == 0:
+                if reimport_existing:
+                    models.ScraperState.set_value(checkpoint_name,
+                                                  question['url'])
+                _commit_batch()
 
+    if reimport_existing:
+        models.ScraperState.set_value(checkpoint_name, None)
     models.db.session.commit()
 
     if new_ask_rows:
@@ -142,19 +183,23 @@ def get_questions(
     logger.info("HTTP: %d kb in %s requests, %.2f seconds",
                 counters['bytes'] / 1024, counters['requests'],
                 counters['download_time'].total_seconds())
+    if 'cache_hit' in counters:
+        logger.info("HTTP cache: %d hit, %d revalidated, %d miss",
+                    counters['cache_hit'], counters['cache_revalidated'],
+                    counters['cache_miss'])
 
     if autoanalyze:
         logger.info("Scheduling jobs for %d questions", len(changed_questions))
-        for question in changed_questions:
-            if question.pdf_url:
-                ocr_question.delay(question.id, autoanalyze=True)
+        for question_id, pdf_url, policy_domain_id in changed_questions:
+            if pdf_url:
+                ocr_question.delay(question_id, autoanalyze=True)
 
-            if question.policy_domain_id is None:
-                calculate_question.delay(question.id)
+            if policy_domain_id is None:
+                calculate_question.delay(question_id)
 
         logger.info("Scheduling jobs for %d answers", len(changed_answers))
-        for answer in changed_answers:
-            ocr_answer.delay(answer.id)
+        for answer_id in changed_answers:
+            ocr_answer.delay(answer_id)
 
 
 @scraper_manager.command
@@ -356,6 +401,8 @@ def get_groups(
         throttle=None,
         no_commit=False,
         year='2012',
+        workers=1,
+        host_rate=None,
         ):
     year = int(year)
 
@@ -364,7 +411,8 @@ def get_groups(
     http_session = create_session(cache_name=cache_name or
                                        _get_config_cache_name(),
                                   throttle=throttle and float(throttle))
-    group_scraper = GroupScraper(http_session)
+    group_scraper = GroupScraper(http_session,
+                                 **_pool_args(workers, host_rate))
 
     mandate_lookup = models.MandateLookup()
     mandate_intervals = defaultdict(list)
@@ -764,7 +812,8 @@ def get_proposals(
 
 
 @scraper_manager.command
-def get_transcripts(start=None, n_sessions=1, cache_name=None, throttle=None):
+def get_transcripts(start=None, n_sessions=1, cache_name=None, throttle=None,
+                    workers=1, host_rate=None, parse_cache=None):
     from mptracker.scraper.transcripts import TranscriptScraper
 
     if start is None:
@@ -772,6 +821,9 @@ def get_transcripts(start=None, n_sessions=1, cache_name=None, throttle=None):
             'select serial from transcript_chapter '
             'order by serial desc limit 1').scalar()
         start = int(max_serial.split('/')[0]) + 1
+        checkpoint = models.ScraperState.get_value('transcripts')
+        if checkpoint is not None:
+            start = max(start, checkpoint + 1)
 
     cdeppk = int(start) - 1
     n_sessions = int(n_sessions)
@@ -779,36 +831,44 @@ def get_transcripts(start=None, n_sessions=1, cache_name=None, throttle=None):
     transcript_scraper = TranscriptScraper(
             session=create_session(cache_name=cache_name or
                                                _get_config_cache_name(),
-                                   throttle=throttle and float(throttle)))
+                                   throttle=throttle and float(throttle)),
+            parse_cache=create_parse_cache(parse_cache),
+            **_pool_args(workers, host_rate))
 
     mandate_lookup = models.MandateLookup()
 
-    transcript_patcher = TablePatcher(models.Transcript,
-                                      models.db.session,
-                                      key_columns=['serial'])
-
-    with transcript_patcher.process() as add:
-        while n_sessions > 0:
-            n_sessions -= 1
-            cdeppk += 1
-            logger.info("Fetching session %s", cdeppk)
-            session_data = transcript_scraper.fetch_session(cdeppk)
-            if session_data is None:
-                logger.info("No content")
-                continue
-            for chapter in session_data.chapters:
-                chapter_row = (models.TranscriptChapter.query
-                                        .filter_by(serial=chapter.serial)
-                                        .first())
-                if chapter_row is None:
-                    chapter_row = models.TranscriptChapter(
-                        serial=chapter.serial)
-                    models.db.session.add(chapter_row)
-                    models.db.session.flush()
+    while n_sessions > 0:
+        n_sessions -= 1
+        cdeppk += 1
+        logger.info("Fetching session %s", cdeppk)
+        session_data = transcript_scraper.fetch_session(cdeppk)
+        if session_data is None:
+            # not published yet; leave the checkpoint so it's retried
+            logger.info("No content")
+            continue
+        for chapter in session_data.chapters:
+            chapter_row = (models.TranscriptChapter.query
+                                    .filter_by(serial=chapter.serial)
+                                    .first())
+            if chapter_row is None:
+                chapter_row = models.TranscriptChapter(
+                    serial=chapter.serial)
+                models.db.session.add(chapter_row)
+                models.db.session.flush()
 
-                chapter_row.date = session_data.date
-                chapter_row.headline = chapter.headline
+            chapter_row.date = session_data.date
+            chapter_row.headline = chapter.headline
 
+            transcript_patcher = TablePatcher(
+                models.Transcript,
+                models.db.session,
+                key_columns=['serial'],
+                filter={'chapter_id': chapter_row.id},
+                bulk_insert=True,
+                fingerprint='fingerprint',
+            )
+
+            with transcript_patcher.process() as add:
                 for paragraph in chapter.paragraphs:
                     if paragraph['mandate_chamber'] != 2:
                         continue
@@ -829,7 +889,8 @@ def get_transcripts(start=None, n_sessions=1, cache_name=None, throttle=None):
                     }
                     add(transcript_data)
 
-    models.db.session.commit()
+        models.ScraperState.set_value('transcripts', cdeppk)
+        _commit_batch()
 
 
 @scraper_manager.command
@@ -921,6 +982,10 @@ def get_votes(
         throttle=None,
         no_commit=False,
         autoanalyze=False,
+        workers=1,
+        host_rate=None,
+        concurrency=None,
+        parse_cache=None,
         ):
     from mptracker.scraper.votes import VoteScraper
 
@@ -928,6 +993,9 @@ def get_votes(
         start = models.db.session.execute(
             'select date from voting_session '
             'order by date desc limit 1').scalar() + ONE_DAY
+        checkpoint = parse_date(models.ScraperState.get_value('votes'))
+        if checkpoint is not None:
+            start = max(start, checkpoint + ONE_DAY)
 
     else:
         start = parse_date(start)
@@ -937,19 +1005,23 @@ def get_votes(
     http_session = create_session(cache_name=cache_name or
                                        _get_config_cache_name(),
                                   throttle=throttle and float(throttle))
-    vote_scraper = VoteScraper(http_session)
+    vote_scraper = VoteScraper(http_session,
+                               parse_cache=create_parse_cache(parse_cache),
+                               **_pool_args(workers, host_rate))
 
+    def scrape_day(the_date):
+        if concurrency:
+            return vote_scraper.scrape_day_concurrent(the_date,
+                                                      int(concurrency))
+        else:
+            return vote_scraper.scrape_day(the_date)
 
-    voting_session_patcher = TablePatcher(
-        models.VotingSession,
-        models.db.session,
-        key_columns=['cdeppk'],
-    )
 
-    vote_patcher = TablePatcher(
+    vote_patcher = GroupPatcher(
         models.Vote,
         models.db.session,
-        key_columns=['voting_session_id', 'mandate_id'],
+        group_column='voting_session_id',
+        key_column='mandate_id',
     )
 
     proposal_ids = {p.cdeppk_cdep: p.id for p in models.Proposal.query}
@@ -957,46 +1029,63 @@ def get_votes(
 
     new_voting_session_list = []
 
-    with voting_session_patcher.process() as add_voting_session:
-        with vote_patcher.process() as add_vote:
-            the_date = start
-            while days > 0 and the_date < date.today():
-                logger.info("Scraping votes from %s", the_date)
-
-                today_has_votes = False
-                for voting_session in vote_scraper.scrape_day(the_date):
-                    today_has_votes = True
-                    record = model_to_dict(
-                        voting_session,
-                        ['cdeppk', 'subject', 'subject_html'],
+    the_date = start
+    while days > 0 and the_date < date.today():
+        logger.info("Scraping votes from %s", the_date)
+
+        voting_session_list = list(scrape_day(the_date))
+        voting_session_patcher = TablePatcher(
+            models.VotingSession,
+            models.db.session,
+            key_columns=['cdeppk'],
+            # by cdeppk, not by date, so a session that moved to another
+            # day is found and updated rather than inserted again
+            filter={'cdeppk': [vs.cdeppk for vs in voting_session_list]},
+            preload=True,
+        )
+
+        today_has_votes = bool(voting_session_list)
+        with voting_session_patcher.process() as add_voting_session:
+            for voting_session in voting_session_list:
+                record = model_to_dict(
+                    voting_session,
+                    ['cdeppk', 'subject', 'subject_html'],
+                )
+                record['date'] = the_date
+                proposal_cdeppk = voting_session.proposal_cdeppk
+                record['proposal_id'] = (proposal_ids.get(proposal_cdeppk)
+                                         if proposal_cdeppk else None)
+                record['final'] = bool("vot final" in
+                                       record['subject'].lower())
+                vs = add_voting_session(record).row
+                if vs.id is None:
+                    models.db.session.flush()
+
+                new_voting_session_list.append(vs.id)
+
+                mandate_ids = []
+                choices = []
+                for vote in voting_session.votes:
+                    mandate = mandate_lookup.find(
+                        vote.mandate_name,
+                        vote.mandate_year,
+                        vote.mandate_number,
                     )
-                    record['date'] = the_date
-                    proposal_cdeppk = voting_session.proposal_cdeppk
-                    record['proposal_id'] = (proposal_ids.get(proposal_cdeppk)
-                                             if proposal_cdeppk else None)
-                    record['final'] = bool("vot final" in
-                                           record['subject'].lower())
-                    vs = add_voting_session(record).row
-                    if vs.id is None:
-                        models.db.session.flush()
-
-                    new_voting_session_list.append(vs.id)
-
-                    for vote in voting_session.votes:
-                        record = model_to_dict(vote, ['choice'])
-                        record['voting_session_id'] = vs.id
-                        mandate = mandate_lookup.find(
-                            vote.mandate_name,
-                            vote.mandate_year,
-                            vote.mandate_number,
-                        )
-                        record['mandate_id'] = mandate.id
-                        add_vote(record)
+                    mandate_ids.append(mandate.id)
+                    choices.append(vote.choice)
+                vote_patcher.patch(vs.id, mandate_ids, {'choice': choices})
 
-                if today_has_votes:
-                    days -= 1
+        if today_has_votes:
+            # days without votes may just not be published yet, so they
+            # don't move the checkpoint and get retried on the next run
+            if not no_commit:
+                models.ScraperState.set_value('votes', the_date.isoformat())
+            days -= 1
+        _commit_batch(no_commit)
 
-                the_date += ONE_DAY
+        the_date += ONE_DAY
+
+    vote_patcher.log_counters()
 
     if no_commit:
         logger.warn("Rolling back the transaction")
@@ -1042,11 +1131,15 @@ def get_vote_controversy(no_commit=False):
 
 @scraper_manager.command
 def get_position(no_commit=False):
-    name_search = models.NameSearch(
-        models.Person.query
-        .join(models.Mandate)
-        .filter(models.Mandate.year == 2012)
-        .all()
+    from mptracker.nlp import FuzzyNameIndex
+
+    name_index = FuzzyNameIndex(
+        (person.name, person)
+        for person in (
+            models.Person.query
+            .join(models.Mandate)
+            .filter(models.Mandate.year == 2012)
+        )
     )
 
     position_patcher = TablePatcher(
@@ -1065,7 +1158,7 @@ def get_position(no_commit=False):
                 continue
 
             name = row['name'].strip()
-            matches = name_search.find(name)
+            matches = name_index.find_all_words(name)
 
             if len(matches) == 1:
                 [person] = matches
@@ -1086,7 +1179,7 @@ def get_position(no_commit=False):
 
         for row in get_gdrive_csv(POSITION_BIROU_CDEP_CSV_KEY):
             name = row['name'].strip()
-            matches = name_search.find(name)
+            matches = name_index.find_all_words(name)
 
             assert len(matches) == 1, \
                 "Expected a single match for %r, got %r" % (name, matches)
@@ -1173,14 +1266,16 @@ def get_committee_attendance(no_commit=False):
     # Numar sedinte comisia speciala
     # Numar prezente deputat la sedintele comisiei speciale in 2013
 
-    person_map = {
-        p.name: p
+    from mptracker.nlp import FuzzyNameIndex, AmbiguousName
+
+    name_index = FuzzyNameIndex(
+        (p.name, p)
         for p in (
             models.Person.query
             .join(models.Person.mandates)
             .filter_by(year=2012)
         )
-    }
+    )
 
     committee_map = {
         re.sub(r'\s+', ' ', c.name): c
@@ -1226,7 +1321,13 @@ def get_committee_attendance(no_commit=False):
         return (committee, attendance_2013)
 
     for row in get_gdrive_csv(COMMITTEE_ROLL_CALL_CSV_KEY):
-        person = person_map[row['Nume'].strip()]
+        try:
+            person = name_index.find(row['Nume'])
+        except AmbiguousName as e:
+            logger.warn("Skipping attendance: %s", e)
+            continue
+        if person is None:
+            raise KeyError(row['Nume'])
         mandate = (
             person.mandates
             .filter_by(year=2012)
@@ -1268,12 +1369,12 @@ def get_committee_attendance(no_commit=False):
 @scraper_manager.command
 def get_romania_curata():
     from os import path
-    from difflib import SequenceMatcher as sm
-    from itertools import permutations
     import json
-    from mptracker.nlp import normalize
+    from mptracker.nlp import normalize, FuzzyNameIndex, AmbiguousName
 
-    sql_names = [person.name for person in models.Person.query.all()]
+    people = models.Person.query.all()
+    person_by_name = {person.name: person for person in people}
+    name_index = FuzzyNameIndex((person.name, person) for person in people)
 
     with open(path.relpath("mptracker/scraper/scraper_curata_out.json"),
               'r', encoding='utf-8') as f:
@@ -1284,38 +1385,23 @@ def get_romania_curata():
             'r', encoding='utf-8') as f:
         person_exceptions = json.load(f)
 
-
-    def matching_score(first_name, second_name):
-        return sm(None, first_name, second_name).ratio() * 100
-
-    def add_person(name, fortune):
-        person = (
-            models.Person.query
-                .filter_by(name=name)
-                .first()
-        )
-        if person != None:
+    def add_person(person, fortune):
+        if person is not None:
             person.romania_curata = "\n".join(fortune)
-            print("Found a match for ", name.encode('utf-8'))
-            sql_names.remove(name)
+            print("Found a match for ", person.name.encode('utf-8'))
+            name_index.discard(person)
 
     for name, fortune in scraper_result:
         name_scraper = normalize(name)
-        max_matching = (0, 0)
 
         if name_scraper in person_exceptions:
-            add_person(person_exceptions[name_scraper], fortune)
-
-        for temporary_sqlname in sql_names:
-            name_sql = normalize(temporary_sqlname)
-            for perm in permutations(name_scraper.split(" ")):
-                current_matching = matching_score(" ".join(perm), name_sql)
-
-                if max_matching[0] < current_matching:
-                    max_matching = (current_matching, temporary_sqlname)
+            add_person(person_by_name.get(person_exceptions[name_scraper]),
+                       fortune)
 
-        if max_matching[0] > 93:
-            add_person(max_matching[1], fortune)
+        try:
+            add_person(name_index.find(name, cutoff=93), fortune)
+        except AmbiguousName as e:
+            logger.warn("Skipping %s", e)
 
     models.db.session.commit()
 
@@ -1323,7 +1409,7 @@ def get_romania_curata():
 @scraper_manager.command
 def assets(file_path, no_commit=False):
     from mptracker.scraper.assets import parse_assets
-    from mptracker.nlp import normalize
+    from mptracker.nlp import FuzzyNameIndex, AmbiguousName
 
     asset_patcher = TablePatcher(
         models.AssetStatement,
@@ -1331,19 +1417,25 @@ def assets(file_path, no_commit=False):
         key_columns=['person_id', 'date'],
     )
 
-    people_map = {
-        normalize(person.name): person.id
+    name_index = FuzzyNameIndex(
+        (person.name, person.id)
         for person in (
             models.Person.query
             .join(models.Person.mandates)
             .filter_by(year=2012)
         )
-    }
+    )
 
     with asset_patcher.process(remove=True) as add_asset:
         for record in parse_assets(file_path):
-            person_name = normalize(record.pop('person_name'))
-            person_id = people_map[person_name]
+            person_name = record.pop('person_name')
+            try:
+                person_id = name_index.find(person_name)
+            except AmbiguousName as e:
+                logger.warn("Skipping assets: %s", e)
+                continue
+            if person_id is None:
+                raise KeyError(person_name)
             del record['constituency']
             del record['county']
             res = add_asset({
@@ -1,19 +1,28 @@
+import os
 import time
+import threading
 from datetime import date, timedelta
-from urllib.parse import urlencode, urlparse, parse_qs
+from urllib.parse import urlencode, urlparse, urljoin, parse_qs
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import re
 import csv
 import io
-from collections import namedtuple
+from collections import namedtuple, deque
+import sqlite3
+import json
+import pickle
+import hashlib
 from path import path
 import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 from werkzeug.urls import url_decode, url_parse
 from pyquery import PyQuery as pq
 from lxml.html.clean import clean_html
 from lxml.html import fromstring, HTMLParser
 from lxml import etree
-from mptracker.common import parse_date as parse_iso_date
+from mptracker.common import parse_date as parse_iso_date, iter_file
 
 logger = logging.getLogger(__name__)
 
@@ -28,21 +37,63 @@ SPREADSHEET_NEW_CSV_URL_TEMPLATE = (
 )
 
 
+class TokenBucket:
+    """ Allow `rate` requests per second, with bursts of up to `burst`. """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
 class Scraper(object):
 
     use_cdep_opener = True
+    cdep_encoding = 'iso-8859-2'
+    # bump this when a parser changes so `ParseCache` forgets old results
+    parser_version = 1
 
-    def __init__(self, session=None):
+    def __init__(self, session=None, max_workers=1, host_rate=None,
+                 parse_cache=None):
         self.session = session or requests.Session()
+        self.max_workers = max_workers
+        self.host_rate = host_rate
+        self.parse_cache = parse_cache
+        self._host_buckets = {}
+        self._host_buckets_lock = threading.Lock()
+
+    def _wait_for_host(self, url):
+        if not self.host_rate:
+            return
+        host = urlparse(url).netloc
+        with self._host_buckets_lock:
+            bucket = self._host_buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.host_rate, burst=self.max_workers)
+                self._host_buckets[host] = bucket
+        bucket.take()
 
     def opener(self, url):
+        self._wait_for_host(url)
         # we need to pass in all the hooks because of a bug in requests 2.0.0
         # https://github.com/kennethreitz/requests/issues/1655
         resp = self.session.get(url, hooks=self.session.hooks)
         if self.use_cdep_opener:
-            text = resp.content.decode('iso-8859-2')
-            # we use utf-16 because the parser's autodetect works fine with it
-            return text.encode('utf-16')
+            # raw bytes; `parse_page` tells lxml how to decode them
+            return resp.content
         else:
             return resp.text
 
@@ -54,10 +105,67 @@ class Scraper(object):
                 url += '&'
             url += urlencode(args)
         logger.debug("Fetching URL %s", url)
-        page = pq(url, parser='html', opener=self.opener)
-        page.make_links_absolute()
+        return self.parse_page(self.opener(url), url)
+
+    def parse_page(self, content, url):
+        if isinstance(content, bytes):
+            page = parse_html(content, self.cdep_encoding)
+        else:
+            page = pq(content, parser='html')
+        # same as `page.make_links_absolute()`, but pyquery's version keeps
+        # state in module globals so it's not safe to call from threads
+        for link in page('a'):
+            link.set('href', urljoin(url, link.get('href')))
         return page
 
+    def cached_parse(self, parse, content, url, *args):
+        """ Return `parse(*args, page)` for the page in `content`. With a
+        `parse_cache`, the result is looked up by the page's hash first, and
+        the page is only parsed if it's not there. """
+        if self.parse_cache is None:
+            return parse(*args, self.parse_page(content, url))
+
+        body = content if isinstance(content, bytes) else content.encode()
+        key = '%s.%s:%s:%s:%r' % (
+            type(self).__name__, parse.__name__, self.parser_version,
+            hashlib.sha1(body).hexdigest(), args,
+        )
+        result = self.parse_cache.get(key)
+        if result is None:
+            result = parse(*args, self.parse_page(content, url))
+            self.parse_cache.save(key, result)
+        return result
+
+    def fetch_many(self, urls, raw=False):
+        """ Fetch `urls` with up to `max_workers` requests in flight and
+        yield the parsed pages in the same order as `urls`. With `raw=True`,
+        yield the unparsed response bodies instead. """
+        return self.pool_map(self.opener if raw else self.fetch_url, urls)
+
+    def pool_map(self, func, items):
+        """ Like `map(func, items)`, but with up to `max_workers` calls
+        running at once. Results are yielded in the order of `items`. """
+        if self.max_workers <= 1:
+            for item in items:
+                yield func(item)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= self.max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def parse_html(content, encoding):
+    """ Parse a page straight from its bytes, without first decoding it
+    to a `str` """
+    parser = HTMLParser(encoding=encoding)
+    return pq(fromstring(content, parser=parser))
+
 
 class GenericModel:
 
@@ -78,21 +186,201 @@ def create_throttle(seconds):
     return hook
 
 
+# How long a cached page is served without asking the server again. `None`
+# means the page never changes once published. The first matching pattern
+# wins; URLs that match nothing use `DEFAULT_CACHE_TTL`.
+CACHE_TTL = [
+    (re.compile(r'/interpelari\.lista\b'), timedelta(hours=6)),
+    (re.compile(r'/upl_pck\.lista\b'), timedelta(hours=6)),
+    (re.compile(r'/upl_com\.lista\b'), timedelta(hours=6)),
+    (re.compile(r'/evot\.data\b'), timedelta(hours=6)),
+    (re.compile(r'/steno\.sumar\b'), timedelta(days=1)),
+    (re.compile(r'/evot\.nominal\b'), None),
+    (re.compile(r'/steno\.stenograma\b'), None),
+    (re.compile(r'\.pdf$', re.IGNORECASE), None),
+]
+
+DEFAULT_CACHE_TTL = timedelta(days=1)
+
+
+class ResponseCache:
+    """ sqlite store of response bodies plus their validators """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS response ('
+                'url TEXT PRIMARY KEY, '
+                'fetched REAL NOT NULL, '
+                'status INTEGER NOT NULL, '
+                'headers TEXT NOT NULL, '
+                'content BLOB NOT NULL)'
+            )
+
+    def get(self, url):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT fetched, status, headers, content '
+                'FROM response WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        (fetched, status, headers, content) = row
+        return {
+            'fetched': fetched,
+            'status': status,
+            'headers': json.loads(headers),
+            'content': bytes(content),
+        }
+
+    def save(self, url, response):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?)',
+                (url, time.time(), response.status_code,
+                 json.dumps(dict(response.headers)), response.content),
+            )
+
+    def save_file(self, url, response, file_path):
+        """ Like `save`, for a streamed response whose body was written to
+        `file_path`. The body is copied into a blob of the right size a
+        chunk at a time, so a large PDF is never read into memory. """
+        with open(file_path, 'rb') as f, self.lock, self.db:
+            size = os.fstat(f.fileno()).st_size
+            cursor = self.db.execute(
+                'INSERT OR REPLACE INTO response '
+                'VALUES (?, ?, ?, ?, zeroblob(?))',
+                (url, time.time(), response.status_code,
+                 json.dumps(dict(response.headers)), size),
+            )
+            with self.db.blobopen('response', 'content',
+                                  cursor.lastrowid) as blob:
+                for chunk in iter_file(f):
+                    blob.write(chunk)
+
+    def touch(self, url):
+        with self.lock, self.db:
+            self.db.execute('UPDATE response SET fetched = ? WHERE url = ?',
+                            (time.time(), url))
+
+
+class RevalidatingSession(requests.Session):
+    """ Serve GET requests from a `ResponseCache` while the page is younger
+    than its TTL (see `CACHE_TTL`); after that, ask the server with a
+    conditional GET and reuse the cached body if it says "304 Not
+    Modified". A `stream=True` request is served from the cache while it's
+    fresh; otherwise it goes to the server and the body isn't cached, the
+    caller can `ResponseCache.save_file` it once it's on disk. """
+
+    def __init__(self, cache, ttl_rules=CACHE_TTL,
+                 default_ttl=DEFAULT_CACHE_TTL):
+        super().__init__()
+        self.cache = cache
+        self.ttl_rules = ttl_rules
+        self.default_ttl = default_ttl
+        self.counters = {'cache_hit': 0, 'cache_revalidated': 0,
+                         'cache_miss': 0}
+
+    def get_ttl(self, url):
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def _cached_response(self, url, entry):
+        response = requests.Response()
+        response.url = url
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry['content']
+        # there's no `raw` to read; `iter_content` serves from `_content`
+        response._content_consumed = True
+        response.elapsed = timedelta()
+        response.from_cache = True
+        return response
+
+    def request(self, method, url, **kwargs):
+        if method.upper() != 'GET' or kwargs.get('params'):
+            return super().request(method, url, **kwargs)
+
+        entry = self.cache.get(url)
+        if entry is not None:
+            ttl = self.get_ttl(url)
+            age = time.time() - entry['fetched']
+            if ttl is None or age < ttl.total_seconds():
+                self.counters['cache_hit'] += 1
+                return self._cached_response(url, entry)
+
+        if kwargs.get('stream'):
+            self.counters['cache_miss'] += 1
+            return super().request(method, url, **kwargs)
+
+        if entry is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            validators = CaseInsensitiveDict(entry['headers'])
+            if 'ETag' in validators:
+                headers['If-None-Match'] = validators['ETag']
+            if 'Last-Modified' in validators:
+                headers['If-Modified-Since'] = validators['Last-Modified']
+            kwargs['headers'] = headers
+
+        response = super().request(method, url, **kwargs)
+
+        if entry is not None and response.status_code == 304:
+            self.counters['cache_revalidated'] += 1
+            self.cache.touch(url)
+            return self._cached_response(url, entry)
+
+        self.counters['cache_miss'] += 1
+        if response.status_code == 200:
+            self.cache.save(url, response)
+        return response
+
+
+class ParseCache:
+    """ sqlite store of parser results, see `Scraper.cached_parse`; also
+    holds OCR results, see `mptracker.common.ocr_url` """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS parsed ('
+                'key TEXT PRIMARY KEY, '
+                'value BLOB NOT NULL)'
+            )
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM parsed WHERE key = ?',
+                                  (key,)).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def save(self, key, value):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?)',
+                            (key, pickle.dumps(value)))
+
+
 def create_session(cache_name=None, throttle=None, counters=False):
     if cache_name:
-        import requests_cache
-        cache_path = PROJECT_ROOT / '_data' / cache_name
-        session = requests_cache.CachedSession(cache_path)
+        cache_path = PROJECT_ROOT / '_data' / (cache_name + '-http.sqlite')
+        session = RevalidatingSession(ResponseCache(cache_path))
 
     else:
         session = requests.Session()
 
     if counters:
-        session.counters = counters_data = {
-            'requests': 0,
-            'bytes': 0,
-            'download_time': timedelta(),
-        }
+        session.counters = counters_data = dict(
+            getattr(session, 'counters', {}),
+            requests=0,
+            bytes=0,
+            download_time=timedelta(),
+        )
 
         def request_count_hook(response, **extra):
             counters_data['requests'] += 1
@@ -112,6 +400,19 @@ def get_cached_session(name='page-cache'):
     return create_session(name)
 
 
+def create_parse_cache(name=None):
+    if not name:
+        return None
+    return ParseCache(PROJECT_ROOT / '_data' / (name + '-parsed.sqlite'))
+
+
+def create_ocr_cache():
+    # unlike the scraper caches this one is on by default
+    cache_dir = PROJECT_ROOT / '_data'
+    cache_dir.makedirs_p()
+    return ParseCache(cache_dir / 'ocr.sqlite')
+
+
 def pqitems(ob, selector=None):
     cls = type(ob)
     if selector is None:
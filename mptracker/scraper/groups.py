@@ -44,12 +44,17 @@ class GroupScraper(Scraper):
         for link in table_ended.items('a'):
             url_set.add(link.attr('href'))
 
-        group_list = [self.fetch_group(url, year) for url in sorted(url_set)]
+        url_list = sorted(url_set)
+        group_list = [
+            self.fetch_group(url, year, page)
+            for url, page in zip(url_list, self.fetch_many(url_list))
+        ]
         group_list.sort(key=lambda g: g.idg)
         return group_list
 
-    def fetch_group(self, group_url, year):
-        group_page = self.fetch_url(group_url)
+    def fetch_group(self, group_url, year, group_page=None):
+        if group_page is None:
+            group_page = self.fetch_url(group_url)
         headline = group_page.find('td.headline')
         parent_td = pq(headline.parents('td')[-1])
         mp_tables = list(parent_td.items('table table'))
@@ -2,6 +2,7 @@
 
 import sys
 import re
+import hashlib
 from datetime import datetime
 import logging
 from path import path
@@ -14,8 +15,9 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-with open(path(__file__).parent / 'question_exceptions.json') as f:
-    exceptions = json.load(f)
+with open(path(__file__).parent / 'question_exceptions.json', 'rb') as f:
+    exceptions_data = f.read()
+    exceptions = json.loads(exceptions_data.decode('utf-8'))
     url_skip = set(exceptions['url_skip'])
     pdf_url_skip = set(exceptions['pdf_url_skip'])
 
@@ -30,6 +32,10 @@ class QuestionScraper(Scraper):
         'Interpelarea': 'interpelation',
     }
 
+    # `get_question` applies the exceptions file, so edits to it must
+    # invalidate cached results too
+    parser_version = '1-' + hashlib.sha1(exceptions_data).hexdigest()[:8]
+
     def __init__(self, skip=never, **kwargs):
         self.skip = skip
         return super().__init__(**kwargs)
@@ -58,8 +64,9 @@ class QuestionScraper(Scraper):
                 pdf_url = link.attr('href')
                 return {"pdf_url": pdf_url}
 
-    def get_question(self, href):
-        page = self.fetch_url(href)
+    def get_question(self, href, page=None):
+        if page is None:
+            page = self.fetch_url(href)
         heading = page('#pageHeader .pageHeaderLinks').text()
         heading_m = self.title_pattern.match(heading)
         assert heading_m is not None, "Could not parse heading %r" % heading
@@ -121,10 +128,13 @@ class QuestionScraper(Scraper):
         question.update(patch)
         return question
 
-    def run(self, year):
+    def run(self, year, resume_after=None):
+        """ Yield the year's questions in index order, starting after the
+        `resume_after` url if it's on the index. """
         index = self.fetch_url('http://www.cdep.ro/pls/parlam/'
                                'interpelari.lista?tip=&dat={year}&idl=1'
                                .format(year=year))
+        href_list = []
         for link in pqitems(index, '#pageContent table a'):
             href = link.attr('href')
             if href in url_skip:
@@ -135,4 +145,11 @@ class QuestionScraper(Scraper):
             if self.skip(href):
                 logger.debug('skipping %r', href)
             else:
-                yield self.get_question(href)
+                href_list.append(href)
+
+        if resume_after in href_list:
+            href_list = href_list[href_list.index(resume_after) + 1:]
+
+        contents = self.fetch_many(href_list, raw=True)
+        for href, content in zip(href_list, contents):
+            yield self.cached_parse(self.get_question, content, href, href)
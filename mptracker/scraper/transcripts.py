@@ -2,11 +2,21 @@
 
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs
+from lxml import etree
 from pyquery import PyQuery as pq
-from mptracker.scraper.common import (Scraper, pqitems, get_cached_session,
+from mptracker.scraper.common import (Scraper, get_cached_session,
                                       parse_profile_url, open_scraper_resource)
 
 
+PARAGRAPH_XPATH = etree.XPath('//*[@id="pageContent"]/table//tr//td//p')
+SPEAKER_XPATH = etree.XPath('.//b//font[@color="#0000FF"]')
+
+
+def element_text(element):
+    """ Same as `PyQuery(element).text()` """
+    return ' '.join(filter(None, (t.strip() for t in element.itertext())))
+
+
 class Session:
 
     def __init__(self):
@@ -31,9 +41,6 @@ class TranscriptScraper(Scraper):
     transcript_url = ('http://www.cdep.ro/pls/steno/steno.data'
                       '?cam=2&idl=1&dat=%s')
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
     def get_session_date(self, page):
         td = page.find(':contains("Sunteţi în secţiunea")')
         date_str = td.parent().text().split()[-1]
@@ -56,12 +63,8 @@ class TranscriptScraper(Scraper):
             headline = pq(headline_el).text()
             yield link, headline
 
-    def get_chapter_serial(self):
-        return '%05d/%02d' % (self.session_cdeppk, self.chapter_serial)
-
-    def next_paragraph_serial(self):
-        self.paragraph_serial += 1
-        return self.get_chapter_serial() + '-%03d' % self.paragraph_serial
+    def get_chapter_serial(self, chapter_serial):
+        return '%05d/%02d' % (self.session_cdeppk, chapter_serial)
 
     def trim_name(self, name):
         name = name.replace(' (din sală)', '')
@@ -71,66 +74,74 @@ class TranscriptScraper(Scraper):
         else:
             return name
 
-    def parse_transcript_page(self, link):
-        page = self.fetch_url(link)
-        table_rows = pqitems(page, '#pageContent > table tr')
+    def parse_transcript_page(self, chapter_serial, link, page=None):
+        if page is None:
+            page = self.fetch_url(link)
         transcript = None
         transcript_chapter = Chapter()
+        transcript_chapter.serial = self.get_chapter_serial(chapter_serial)
+        paragraph_serial = 0
 
         def save_paragraph():
             text = "\n".join(transcript.pop('text_buffer'))
             transcript['text'] = text
             transcript_chapter.paragraphs.append(transcript)
 
-        for tr in table_rows:
-            for td in pqitems(tr, 'td'):
-                for paragraph in pqitems(td, 'p'):
-                    speakers = paragraph('b font[color="#0000FF"]')
-                    if speakers:
-                        if transcript:
-                            save_paragraph()
-                        serial = self.next_paragraph_serial()
-                        assert len(speakers) == 1
-                        speaker_name = self.trim_name(speakers.text())
-                        link = speakers.parents('a')
-                        if not link:
-                            transcript = None
-                            continue
-                        (year, chamber, number) = \
-                            parse_profile_url(link.attr('href'))
-                        transcript = Transcript({
-                            'mandate_year': year,
-                            'mandate_chamber': chamber,
-                            'mandate_number': number,
-                            'speaker_name': speaker_name,
-                            'text_buffer': [],
-                            'serial': serial,
-                        })
-
-                    else:
-                        if transcript is None:
-                            continue
-                        text = paragraph.text()
-                        transcript['text_buffer'].append(text)
+        # one pass over the lxml tree; building a PyQuery object for every
+        # `tr`, `td` and `p` used to be most of the parsing time
+        for paragraph in PARAGRAPH_XPATH(page[0]):
+            speakers = SPEAKER_XPATH(paragraph)
+            if speakers:
+                if transcript:
+                    save_paragraph()
+                paragraph_serial += 1
+                serial = transcript_chapter.serial + '-%03d' % paragraph_serial
+                assert len(speakers) == 1
+                speaker_name = self.trim_name(element_text(speakers[0]))
+                link = speakers[0].xpath('ancestor::a')
+                if not link:
+                    transcript = None
+                    continue
+                (year, chamber, number) = \
+                    parse_profile_url(link[0].get('href'))
+                transcript = Transcript({
+                    'mandate_year': year,
+                    'mandate_chamber': chamber,
+                    'mandate_number': number,
+                    'speaker_name': speaker_name,
+                    'text_buffer': [],
+                    'serial': serial,
+                })
+
+            else:
+                if transcript is None:
+                    continue
+                transcript['text_buffer'].append(element_text(paragraph))
 
         if transcript:
             save_paragraph()
 
         return transcript_chapter
 
+    def fetch_chapter(self, chapter):
+        (chapter_serial, (link, headline)) = chapter
+        transcript_chapter = self.cached_parse(
+            self.parse_transcript_page, self.opener(link), link,
+            chapter_serial, link,
+        )
+        transcript_chapter.headline = headline
+        return transcript_chapter
+
     def fetch_session(self, cdeppk):
         self.session_cdeppk = cdeppk
-        self.chapter_serial = 0
         transcript_session = Session()
         session_page = self.fetch_url(self.session_url % self.session_cdeppk)
         transcript_session.date = self.get_session_date(session_page)
         if transcript_session.date is None:
             return None
-        for link, headline in self.chapters_for_session(session_page):
-            self.chapter_serial += 1
-            self.paragraph_serial = 0
-            transcript_chapter = self.parse_transcript_page(link)
-            transcript_chapter.headline = headline
-            transcript_chapter.serial = self.get_chapter_serial()
-            transcript_session.chapters.append(transcript_chapter)
+        # chapter serials come from the position in the index, so chapters
+        # can be fetched and parsed in any order
+        chapter_list = enumerate(self.chapters_for_session(session_page), 1)
+        transcript_session.chapters = list(
+            self.pool_map(self.fetch_chapter, chapter_list))
         return transcript_session
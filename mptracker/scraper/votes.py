@@ -1,4 +1,6 @@
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pyquery import PyQuery as pq
 from mptracker.scraper.common import (Scraper, GenericModel, url_args,
                                       parse_profile_url)
@@ -33,20 +35,69 @@ class VoteScraper(Scraper):
     DAY_URL = 'http://www.cdep.ro/pls/steno/evot.data?dat=%s'
     VOTE_URL = 'http://www.cdep.ro/pls/steno/evot.nominal?idv=%d'
 
-    def scrape_day(self, day):
-        url = self.DAY_URL % day.strftime('%Y%m%d')
-        page = self.fetch_url(url)
+    def list_day(self, day, page=None):
+        if page is None:
+            page = self.fetch_url(self.DAY_URL % day.strftime('%Y%m%d'))
         table = page.find('#pageContent table')
+        vote_cdeppk_list = []
         for link in table.items('td:nth-child(1) a'):
             href = link.attr('href')
             assert href.startswith('http://www.cdep.ro/pls/'
                                    'steno/evot.nominal?idv=')
-            vote_cdeppk = url_args(href).get('idv', type=int)
-            yield self.scrape_vote(vote_cdeppk)
+            vote_cdeppk_list.append(url_args(href).get('idv', type=int))
+        return vote_cdeppk_list
+
+    def scrape_day(self, day):
+        vote_cdeppk_list = self.list_day(day)
+        vote_urls = [self.VOTE_URL % vote_cdeppk
+                     for vote_cdeppk in vote_cdeppk_list]
+        vote_contents = self.fetch_many(vote_urls, raw=True)
+        for vote_cdeppk, url, content in zip(vote_cdeppk_list, vote_urls,
+                                             vote_contents):
+            yield self.cached_parse(self.scrape_vote, content, url,
+                                    vote_cdeppk)
+
+    async def scrape_day_async(self, day, concurrency=4, executor=None):
+        """ Fetch the day's `evot.nominal` pages concurrently, at most
+        `concurrency` at a time, and parse each one in `executor`. Returns
+        the list of voting sessions in the same order as `scrape_day`. """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                return await loop.run_in_executor(executor, self.opener, url)
+
+        day_url = self.DAY_URL % day.strftime('%Y%m%d')
+        day_page = self.parse_page(await fetch(day_url), day_url)
+
+        async def scrape(vote_cdeppk):
+            url = self.VOTE_URL % vote_cdeppk
+            content = await fetch(url)
+            return await loop.run_in_executor(
+                executor, self.cached_parse,
+                self.scrape_vote, content, url, vote_cdeppk)
+
+        return await asyncio.gather(*[
+            scrape(vote_cdeppk)
+            for vote_cdeppk in self.list_day(day, day_page)
+        ])
+
+    def scrape_day_concurrent(self, day, concurrency=4):
+        """ Blocking wrapper around `scrape_day_async`, yields the same
+        records as `scrape_day`. """
+        loop = asyncio.new_event_loop()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                voting_sessions = loop.run_until_complete(
+                    self.scrape_day_async(day, concurrency, executor))
+        finally:
+            loop.close()
+        yield from voting_sessions
 
-    def scrape_vote(self, vote_cdeppk):
-        url = self.VOTE_URL % vote_cdeppk
-        page = self.fetch_url(url)
+    def scrape_vote(self, vote_cdeppk, page=None):
+        if page is None:
+            page = self.fetch_url(self.VOTE_URL % vote_cdeppk)
         subject_label = list(page.items(':contains("Subiect vot:")'))[0]
         subject_td = list(subject_label.parent().items('td'))[1]
         voting_session = VotingSession(
@@ -1,7 +1,9 @@
+import time
+import threading
 from datetime import date
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from itertools import groupby
-from sqlalchemy import func, distinct, and_
+from sqlalchemy import func, distinct, and_, event
 from sqlalchemy.orm import joinedload, aliased
 from flask import json
 from mptracker.common import PARTY_ORDER
@@ -42,6 +44,105 @@ from mptracker.website.dal_person import DalPerson
 from mptracker.website.dal_party import DalParty
 
 
+PersonRecord = namedtuple('PersonRecord', ['name', 'name_first_last', 'slug'])
+
+
+class PersonNameIndex:
+    """ Process-wide `NameSearch` over the 2012 deputies, so name searches
+    are answered from memory. It's rebuilt after Person or Mandate rows are
+    written by this process, or once it's `max_age` seconds old, to pick up
+    changes made by the scrapers. """
+
+    max_age = 600
+
+    def __init__(self):
+        self.name_search = None
+        self.built = None
+        self.lock = threading.Lock()
+
+    def invalidate(self, *args):
+        self.name_search = None
+
+    def build(self):
+        query = (
+            Person.query
+            .join(Person.mandates)
+            .filter_by(year=2012)
+            .order_by(Person.first_name, Person.last_name)
+        )
+        return NameSearch([
+            PersonRecord(p.name, p.name_first_last, p.slug)
+            for p in query
+        ])
+
+    def get(self):
+        name_search = self.name_search
+        if (name_search is None or
+                time.monotonic() - self.built > self.max_age):
+            with self.lock:
+                if self.name_search is name_search:
+                    self.name_search = self.build()
+                    self.built = time.monotonic()
+                name_search = self.name_search
+        return name_search
+
+
+person_name_index = PersonNameIndex()
+
+for _model in [Person, Mandate]:
+    for _event in ['after_insert', 'after_update', 'after_delete']:
+        event.listen(_model, _event, person_name_index.invalidate)
+
+
+SEARCH_SQL = """\
+WITH search AS (
+    SELECT plainto_tsquery('romanian', :text_query) AS tsquery
+),
+hits AS (
+    SELECT 'person' AS type, person.id,
+           ts_rank(person.romania_curata_tsv, tsquery) AS rank
+    FROM person, search WHERE person.romania_curata_tsv @@ tsquery
+  UNION ALL
+    SELECT 'transcript', transcript.id,
+           ts_rank(transcript.text_tsv, tsquery)
+    FROM transcript, search WHERE transcript.text_tsv @@ tsquery
+  UNION ALL
+    SELECT ocr_text.parent, ocr_text.id,
+           ts_rank(ocr_text.text_tsv, tsquery)
+    FROM ocr_text, search WHERE ocr_text.text_tsv @@ tsquery
+      AND ocr_text.parent IN ('proposal', 'question')
+  UNION ALL
+    SELECT 'question', question.id,
+           ts_rank(question.title_tsv, tsquery)
+    FROM question, search WHERE question.title_tsv @@ tsquery
+),
+top_hits AS (
+    SELECT type, id, sum(rank) AS rank FROM hits
+    GROUP BY type, id
+    ORDER BY rank DESC
+    LIMIT :limit
+)
+SELECT top_hits.type, top_hits.id, top_hits.rank,
+       coalesce(person.first_name || ' ' || person.last_name,
+                transcript_chapter.headline,
+                proposal.title,
+                question.title) AS title,
+       coalesce(person.slug, transcript_chapter.serial) AS slug
+FROM top_hits
+LEFT JOIN person
+  ON top_hits.type = 'person' AND person.id = top_hits.id
+LEFT JOIN transcript
+  ON top_hits.type = 'transcript' AND transcript.id = top_hits.id
+LEFT JOIN transcript_chapter
+  ON transcript_chapter.id = transcript.chapter_id
+LEFT JOIN proposal
+  ON top_hits.type = 'proposal' AND proposal.id = top_hits.id
+LEFT JOIN question
+  ON top_hits.type = 'question' AND question.id = top_hits.id
+ORDER BY top_hits.rank DESC
+"""
+
+
 class DalCounty:
 
     def __init__(self, county_code, missing=KeyError):
@@ -103,15 +204,10 @@ class DataAccess:
         return dict(mandate_data)
 
     def search_person_by_name(self, name_query):
-        name_search = NameSearch(
-            Person.query
-            .join(Person.mandates)
-            .filter_by(year=2012)
-            .order_by(Person.first_name, Person.last_name)
-        )
+        name_search = person_name_index.get()
         return [
             {'name': person.name_first_last, 'slug': person.slug}
-            for person in name_search.find(name_query.strip())
+            for person in name_search.find_prefix(name_query.strip())
         ]
 
     def search_person_by_policy(self, policy_slug):
@@ -185,7 +281,7 @@ class DataAccess:
             person_query = (
                 person_query
                 .filter(
-                    "to_tsvector('romanian', person.romania_curata) "
+                    "person.romania_curata_tsv "
                     "@@ plainto_tsquery('romanian', :contracts_query)"
                 )
                 .params(contracts_query=contracts_query)
@@ -196,6 +292,27 @@ class DataAccess:
             for person in person_query
         ]
 
+    def search(self, text_query, limit=20):
+        """ Ranked full-text search over people's Romania Curată records,
+        transcripts, question titles and the text of questions and
+        proposals, using the `*_tsv` columns from `FULLTEXT_COLUMNS`. """
+        if not text_query.strip():
+            return []
+        rows = db.session.execute(db.text(SEARCH_SQL), {
+            'text_query': text_query,
+            'limit': limit,
+        }).fetchall()
+        return [
+            {
+                'type': row.type,
+                'id': row.id,
+                'title': row.title,
+                'slug': row.slug,
+                'rank': row.rank,
+            }
+            for row in rows
+        ]
+
     def get_person(self, person_slug):
         return DalPerson(person_slug, self, self.missing)
 
@@ -710,23 +710,18 @@ class DalPerson:
         return rv
 
 
-WORDCLOUD_SQL = """\
-WITH words AS (
-    SELECT unnest(regexp_split_to_array(lower(text), '\M\W*\m')) AS word
-    FROM ocr_text
-    JOIN proposal ON ocr_text.id = proposal.id
-    JOIN sponsorship ON proposal.id = sponsorship.proposal_id
-    WHERE sponsorship.mandate_id = '%(mandate_id)s'
-)
-SELECT word, count(*) as n FROM words
-WHERE char_length(word) > 4
+TOP_WORDS_SQL = """\
+SELECT word, count FROM mandate_word
+WHERE mandate_id = :mandate_id
+  AND count > 0
   AND unaccent(word) NOT IN (SELECT id FROM stopword)
-GROUP BY word
-ORDER BY n DESC
-LIMIT %(number)d;
+ORDER BY count DESC
+LIMIT :number
 """
 
 
 def get_top_words(mandate_id, number):
-    query = WORDCLOUD_SQL % {'mandate_id': mandate_id, 'number': number}
-    return list(tuple(r) for r in db.session.execute(query))
+    query = db.text(TOP_WORDS_SQL)
+    rows = db.session.execute(query, {'mandate_id': mandate_id,
+                                      'number': number})
+    return list(tuple(r) for r in rows)
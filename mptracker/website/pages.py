@@ -265,6 +265,25 @@ def person_index_search_contracts():
     return flask.jsonify(results=results)
 
 
+@pages.route('/_cauta')
+def search():
+    results = dal.search(flask.request.args.get('q', ''))
+    for item in results:
+        if item['type'] == 'person':
+            item['url'] = flask.url_for('.person_detail',
+                                        person_slug=item['slug'])
+        elif item['type'] == 'transcript':
+            item['url'] = flask.url_for('.transcript_chapter',
+                                        serial=item['slug'])
+        elif item['type'] == 'proposal':
+            item['url'] = flask.url_for('.policy_proposal',
+                                        proposal_id=item['id'])
+        elif item['type'] == 'question':
+            item['url'] = flask.url_for('.person_question',
+                                        question_id=item['id'])
+    return flask.jsonify(results=results)
+
+
 def _add_activity_url(person_slug, item):
     if item['type'] == 'proposal':
         item['url'] = flask.url_for(
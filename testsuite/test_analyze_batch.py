@@ -0,0 +1,92 @@
+""" `analyze_batch` writes Match rows with COPY and UPDATE statements;
+point `MPTRACKER_TEST_DATABASE` at an empty database to run these
+tests. """
+
+import pytest
+from path import path
+
+QUESTION_TEXT = {
+    1: "Când se repară străzile din jurul Basarab Tower și Herăstrău?",
+    2: "Care este situația școlilor din Băneasa și de lângă Afi Palace Mall?",
+    3: "Ce măsuri se iau pentru școlile Albanezilor din România?",
+}
+
+
+@pytest.fixture
+def asks(pg_app):
+    from mptracker import models
+    import mptracker
+    pg_app.root_path = path(mptracker.__file__).parent
+    chamber = models.Chamber(slug='cdep')
+    county = models.County(name="București", geonames_code=10)
+    mandates = {
+        'county': models.Mandate(
+            person=models.Person(slug='ion-popescu', name="Popescu Ion"),
+            chamber=chamber, county=county, year=2012),
+        'minority': models.Mandate(
+            person=models.Person(slug='vasile-ionescu',
+                                 name="Ionescu Vasile"),
+            chamber=chamber, minority=True, year=2012),
+    }
+    asks = {}
+    for n, mandate in [(1, 'county'), (2, 'county'), (3, 'minority')]:
+        question = models.Question(title="Întrebarea %d" % n)
+        models.db.session.add(question)
+        models.db.session.flush()
+        models.db.session.add(models.OcrText(id=question.id, parent='question',
+                                             text=QUESTION_TEXT[n]))
+        asks[n] = models.Ask(question=question, mandate=mandates[mandate])
+        models.db.session.add(asks[n])
+    models.db.session.flush()
+
+    # ask 2 was analyzed before, ask 3 was scored by hand
+    models.db.session.add(models.Match(id=asks[2].id, parent='ask',
+                                       data='{"top_matches": []}', score=0))
+    models.db.session.add(models.Match(id=asks[3].id, parent='ask',
+                                       data='{"top_matches": []}',
+                                       manual=True, score=11))
+    models.db.session.commit()
+    return {n: ask.id for n, ask in asks.items()}
+
+
+def matches():
+    from flask import json
+    from mptracker import models
+    models.db.session.expire_all()
+    return {
+        m.id: (json.loads(m.data), m.manual, m.score)
+        for m in models.Match.query
+    }
+
+
+def test_batch_inserts_and_updates_matches(asks):
+    from mptracker.questions import analyze_batch
+    analyze_batch(force=True, processes=1)
+    result = matches()
+
+    assert sorted(result) == sorted(asks.values())
+    for n in [1, 2]:
+        (data, manual, score) = result[asks[n]]
+        assert not manual
+        assert score == len(data['top_matches']) > 0
+    (data, manual, score) = result[asks[3]]
+    assert data['top_matches']
+    assert manual and score == 11
+
+
+def test_batch_skips_analyzed_asks_unless_forced(asks):
+    from mptracker.questions import analyze_batch
+    analyze_batch(processes=1)
+    result = matches()
+    assert result[asks[2]] == ({'top_matches': []}, False, 0)
+    assert result[asks[3]] == ({'top_matches': []}, True, 11)
+    assert result[asks[1]][0]['top_matches']
+
+
+def test_batch_gives_same_results_as_analyze(asks):
+    from mptracker.questions import analyze, analyze_batch
+    analyze_batch(force=True, processes=1)
+    batch_result = matches()
+    for ask_id in asks.values():
+        analyze(ask_id)
+    assert matches() == batch_result
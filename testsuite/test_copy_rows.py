@@ -0,0 +1,79 @@
+""" The COPY path of `insert_rows` only runs on PostgreSQL; point
+`MPTRACKER_TEST_DATABASE` at an empty database for the tests that
+write rows. `copy_text` is tested without a database. """
+
+from datetime import date, datetime
+import uuid
+
+PERSON_ID = '00000000-0000-0000-0000-000000000001'
+STATEMENT_ID = '00000000-0000-0000-0000-00000000001%d'
+AWKWARD_TEXT = "tab\there\nnew line\r\nback\\slash \\N \"quoted\" ăîșț"
+
+
+def test_copy_text_escapes_special_characters():
+    from mptracker.dbutil import copy_text
+    assert copy_text("a\tb") == r"a\tb"
+    assert copy_text("a\nb\r\n") == r"a\nb\r\n"
+    assert copy_text("C:\\dir\\file") == r"C:\\dir\\file"
+    # a literal backslash-N must not read back as NULL
+    assert copy_text("\\N") == r"\\N"
+    assert copy_text("ăîșț") == "ăîșț"
+
+
+def test_copy_text_null_and_booleans():
+    from mptracker.dbutil import copy_text
+    assert copy_text(None) == r"\N"
+    assert copy_text("") == ""
+    assert copy_text(True) == "t"
+    assert copy_text(False) == "f"
+    assert copy_text(0) == "0"
+
+
+def test_copy_text_dates():
+    from mptracker.dbutil import copy_text
+    assert copy_text(date(2013, 3, 4)) == "2013-03-04"
+    assert copy_text(datetime(2013, 3, 4, 5, 6, 7)) == "2013-03-04T05:06:07"
+    assert copy_text(date.max) == "infinity"
+    assert copy_text(date.min) == "-infinity"
+
+
+def test_copy_text_uuids_and_json():
+    from flask import json
+    from mptracker.dbutil import copy_text, JsonString
+    value = uuid.UUID(PERSON_ID)
+    assert copy_text(value) == PERSON_ID
+
+    bound = JsonString().process_bind_param({'text': "a\tb\\c"}, None)
+    assert copy_text(bound) == r'{"text": "a\\tb\\\\c"}'
+    assert json.loads(bound) == {'text': "a\tb\\c"}
+
+
+def test_insert_rows_copies_values_verbatim(pg_app):
+    from mptracker import models
+    from mptracker.patcher import insert_rows
+    raw_data = {'text': AWKWARD_TEXT, 'values': [1, None]}
+    with models.db.engine.begin() as connection:
+        insert_rows(connection, models.Person.__table__,
+                    ['id', 'slug', 'first_name', 'last_name'], [
+                        {'id': PERSON_ID, 'slug': 'ion',
+                         'first_name': AWKWARD_TEXT, 'last_name': None},
+                    ])
+        insert_rows(connection, models.AssetStatement.__table__,
+                    ['id', 'person_id', 'date', 'raw_data', 'net_worth_eur'],
+                    [
+                        {'id': STATEMENT_ID % n, 'person_id': PERSON_ID,
+                         'date': date(2013, 3, n), 'raw_data': raw_data,
+                         'net_worth_eur': None if n == 1 else n}
+                        for n in [1, 2, 3]
+                    ])
+
+    person = models.Person.query.get(PERSON_ID)
+    assert person.first_name == AWKWARD_TEXT
+    assert person.last_name is None
+
+    statements = (models.AssetStatement.query
+                  .order_by(models.AssetStatement.id).all())
+    assert [s.date for s in statements] == [date(2013, 3, n)
+                                            for n in [1, 2, 3]]
+    assert [s.net_worth_eur for s in statements] == [None, 2, 3]
+    assert all(s.raw_data == raw_data for s in statements)
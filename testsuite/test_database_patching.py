@@ -14,6 +14,7 @@ class Thing(db.Model):
     code = db.Column(db.String)
     number = db.Column(db.Integer)
     name = db.Column(db.String)
+    fingerprint = db.Column(db.String)
 
 
 @pytest.fixture
@@ -105,3 +106,151 @@ def test_patcher_add_returns_row(patcher):
     row1 = patcher.add({'code': 'an', 'name': "Anne"}).row
     row2 = patcher.add({'code': 'an', 'name': "Annette"}).row
     assert row1 == row2
+
+
+@pytest.fixture
+def preload_patcher(db_app):
+    from mptracker.patcher import TablePatcher
+    return TablePatcher(Thing, db.session, key_columns=['code'],
+                        preload=True, batch_size=2)
+
+
+def test_preload_insert_update_and_remove(preload_patcher):
+    records = [{'code': 'an', 'name': "Anne"},
+               {'code': 'bo', 'name': "Bob"},
+               {'code': 'cl', 'name': "Claire"}]
+    preload_patcher.update(records)
+    records[0]['name'] = "Annette"
+    with preload_patcher.process(remove=True) as add:
+        results = [add(record) for record in records[:2]]
+    assert [(r.is_new, r.is_changed) for r in results] == \
+        [(False, True), (False, False)]
+    assert sorted([t.name for t in Thing.query]) == ["Annette", "Bob"]
+
+
+def test_preload_finds_rows_added_in_same_run(preload_patcher):
+    row1 = preload_patcher.add({'code': 'an', 'name': "Anne"}).row
+    result = preload_patcher.add({'code': 'an', 'name': "Annette"})
+    assert result.row is row1
+    assert not result.is_new
+    assert [t.name for t in Thing.query] == ["Annette"]
+
+
+def test_preload_honors_filter(db_app):
+    from mptracker.patcher import TablePatcher
+    records = [{'code': 'an', 'number': 1, 'name': "Anne"},
+               {'code': 'bo', 'number': 2, 'name': "Bob"}]
+    TablePatcher(Thing, db.session, key_columns=['code']).update(records)
+    patcher = TablePatcher(Thing, db.session, key_columns=['code'],
+                           filter={'number': 1}, preload=True)
+    patcher.update(records[:1])
+    assert list(patcher.rows_by_key) == [('an',)]
+
+
+def test_filter_matches_list_of_values(db_app):
+    from mptracker.patcher import TablePatcher
+    records = [{'code': 'an', 'number': 1, 'name': "Anne"},
+               {'code': 'bo', 'number': 2, 'name': "Bob"},
+               {'code': 'cy', 'number': 3, 'name': "Cyril"}]
+    TablePatcher(Thing, db.session, key_columns=['code']).update(records)
+    patcher = TablePatcher(Thing, db.session, key_columns=['code'],
+                           filter={'number': [1, 2]}, preload=True)
+    patcher.update(records[:1], remove=True)
+    assert sorted(patcher.rows_by_key) == [('an',), ('bo',)]
+    assert sorted(t.code for t in Thing.query) == ['an', 'cy']
+
+
+@pytest.fixture
+def bulk_patcher(db_app):
+    from mptracker.patcher import TablePatcher
+    return TablePatcher(Thing, db.session, key_columns=['code'],
+                        bulk_insert=True, batch_size=2)
+
+
+def test_bulk_insert_counts_and_writes_new_rows(bulk_patcher):
+    records = [{'code': 'an', 'name': "Anne"},
+               {'code': 'bo', 'number': 2, 'name': "Bob"},
+               {'code': 'cl', 'name': "Claire"}]
+    with bulk_patcher.process() as add:
+        results = [add(record) for record in records]
+        assert [r.row.code for r in results] == ['an', 'bo', 'cl']
+        assert all(r.is_new and r.is_changed for r in results)
+    assert sorted((t.code, t.number, t.name) for t in Thing.query) == \
+        [('an', None, "Anne"), ('bo', 2, "Bob"), ('cl', None, "Claire")]
+
+
+def test_bulk_insert_updates_rows_it_already_wrote(bulk_patcher):
+    with bulk_patcher.process() as add:
+        add({'code': 'an', 'name': "Anne"})
+        bulk_patcher.flush()
+        result = add({'code': 'an', 'name': "Annette"})
+    assert (result.is_new, result.is_changed) == (False, True)
+    assert [t.name for t in Thing.query] == ["Annette"]
+
+
+def test_bulk_insert_with_remove(bulk_patcher):
+    records = [{'code': 'an', 'name': "Anne"},
+               {'code': 'bo', 'name': "Bob"}]
+    bulk_patcher.update(records)
+    bulk_patcher.update(records[1:] + [{'code': 'cl', 'name': "Claire"}],
+                        remove=True)
+    assert sorted([t.name for t in Thing.query]) == ["Bob", "Claire"]
+
+
+def test_remove_reports_count(patcher):
+    records = [{'code': 'an', 'name': "Anne"},
+               {'code': 'bo', 'name': "Bob"},
+               {'code': 'cl', 'name': "Claire"}]
+    patcher.update(records)
+    with patcher.process() as add:
+        add(records[1])
+        assert patcher.delete_unseen() == 2
+    assert [t.name for t in Thing.query] == ["Bob"]
+
+
+def test_fingerprint_skips_unchanged_rows(db_app):
+    from mptracker.patcher import TablePatcher, RowFingerprint
+    records = [{'code': 'an', 'name': "Anne"},
+               {'code': 'bo', 'name': "Bob"}]
+    patcher = TablePatcher(Thing, db.session, key_columns=['code'],
+                           preload=True, fingerprint='fingerprint')
+    patcher.update(records)
+    assert all(t.fingerprint for t in Thing.query)
+
+    records[0]['name'] = "Annette"
+    with patcher.process() as add:
+        [changed, unchanged] = [add(record) for record in records]
+    assert changed.is_changed and changed.row.name == "Annette"
+    assert not unchanged.is_changed
+    assert isinstance(unchanged.row, RowFingerprint)
+    assert sorted([t.name for t in Thing.query]) == ["Annette", "Bob"]
+
+
+def test_group_patcher_diffs_one_group(db_app):
+    from mptracker.patcher import TablePatcher, GroupPatcher
+    TablePatcher(Thing, db.session, key_columns=['code', 'number']).update([
+        {'code': 'an', 'number': 1, 'name': "Anne"},
+        {'code': 'bo', 'number': 1, 'name': "Bob"},
+        {'code': 'an', 'number': 2, 'name': "Anne"},
+    ])
+    patcher = GroupPatcher(Thing, db.session,
+                           group_column='number', key_column='code')
+    patcher.patch(1, ['an', 'bo', 'cl'],
+                  {'name': ["Annette", "Bob", "Claire"]})
+
+    assert patcher.counters == {'n_add': 1, 'n_update': 1, 'n_ok': 1}
+    db.session.expire_all()
+    assert sorted((t.number, t.code, t.name) for t in Thing.query) == [
+        (1, 'an', "Annette"), (1, 'bo', "Bob"), (1, 'cl', "Claire"),
+        (2, 'an', "Anne"),
+    ]
+
+
+def test_iter_id_chunks(db_app):
+    from mptracker.dbutil import iter_id_chunks
+    for n in range(7):
+        db.session.add(Thing(id='t%d' % n, number=n))
+    db.session.commit()
+    query = db.session.query(Thing.id).filter(Thing.number != 3)
+    chunks = list(iter_id_chunks(query, Thing.id, chunk_size=4))
+    assert chunks == [['t0', 't1', 't2', 't4'], ['t5', 't6']]
@@ -0,0 +1,41 @@
+import io
+import pytest
+import flask
+
+
+@pytest.fixture
+def dump_app(request):
+    from mptracker import models
+    app = flask.Flask('__main__')
+    models.db.init_app(app)
+    ctx = app.app_context()
+    ctx.push()
+    models.MemberCount.__table__.create(models.db.engine)
+    request.addfinalizer(ctx.pop)
+    return app
+
+
+def test_dump_and_load_round_trip(dump_app):
+    from mptracker import models
+    records = [('pnl-2012', 'PNL', 2012, 101),
+               ('psd-2012', 'PSD', 2012, 150)]
+    for id, short_name, year, count in records:
+        models.db.session.add(models.MemberCount(
+            id=id, short_name=short_name, year=year, count=count))
+    models.db.session.commit()
+
+    dump_file = io.StringIO()
+    assert models.dump('member_count', _file=dump_file) == 2
+    models.MemberCount.query.delete()
+    models.db.session.commit()
+
+    dump_file.seek(0)
+    models.load('member_count', _file=dump_file)
+    rows = models.MemberCount.query.order_by('id')
+    assert [(r.id, r.short_name, r.year, r.count) for r in rows] == records
+
+
+def test_scraper_state_is_not_dumped(dump_app):
+    from mptracker import models
+    assert 'scraper_state' not in models.get_model_map()
+    assert 'member_count' in models.get_model_map()
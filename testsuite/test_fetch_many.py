@@ -0,0 +1,104 @@
+from path import path
+
+PAGES_DIR = path(__file__).abspath().parent / 'pages'
+STENO_URL = 'http://www.cdep.ro/pls/steno/steno.stenograma?ids=7277&idm=%d'
+
+
+def test_fetch_many_preserves_order(session):
+    from mptracker.scraper.common import Scraper
+
+    urls = [STENO_URL % n for n in range(1, 13)]
+    for n, url in enumerate(urls, 1):
+        session.url_map[url] = PAGES_DIR / ('steno.stenograma-7277-%d' % n)
+
+    serial_pages = list(Scraper(session).fetch_many(urls))
+    pooled_pages = list(Scraper(session, max_workers=4).fetch_many(urls))
+
+    assert len(pooled_pages) == 12
+    assert ([p.find('#pageContent').text() for p in pooled_pages] ==
+            [p.find('#pageContent').text() for p in serial_pages])
+
+
+def test_token_bucket_limits_rate(monkeypatch):
+    from mptracker.scraper import common
+
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(common.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(common.time, 'sleep', sleep)
+
+    bucket = common.TokenBucket(rate=2, burst=2)
+    for n in range(4):
+        bucket.take()
+
+    assert sleeps == [0.5, 0.5]
+
+
+def test_parse_cache_skips_parsing_known_pages(session, tmpdir):
+    from mptracker.scraper.common import Scraper, ParseCache
+
+    url = STENO_URL % 1
+    session.url_map[url] = PAGES_DIR / 'steno.stenograma-7277-1'
+    parsed = []
+
+    def parse_text(page):
+        parsed.append(page)
+        return page.find('#pageContent').text()
+
+    scraper = Scraper(session, parse_cache=ParseCache(str(tmpdir / 'p.db')))
+    [content] = scraper.fetch_many([url], raw=True)
+    first = scraper.cached_parse(parse_text, content, url)
+    second = scraper.cached_parse(parse_text, content, url)
+
+    assert first == second
+    assert len(parsed) == 1
+
+
+def test_ocr_cache_is_created_on_demand(tmpdir, monkeypatch):
+    from mptracker.scraper import common
+    monkeypatch.setattr(common, 'PROJECT_ROOT', path(str(tmpdir)))
+    cache = common.create_ocr_cache()
+    cache.save('digest:ron:3:1', ['page one', 'page two'])
+    assert (path(str(tmpdir)) / '_data' / 'ocr.sqlite').isfile()
+    assert common.create_ocr_cache().get('digest:ron:3:1') == \
+        ['page one', 'page two']
+
+
+def test_ocr_url_reuses_text_of_same_pdf(tmpdir, monkeypatch):
+    import flask
+    from mock import Mock
+    from mptracker import common
+    from mptracker.scraper import common as scraper_common
+    monkeypatch.setattr(scraper_common, 'PROJECT_ROOT', path(str(tmpdir)))
+    response = Mock(status_code=200, from_cache=True,
+                    iter_content=lambda size: [b'%PDF-1.4 same bytes'])
+    monkeypatch.setattr(scraper_common, 'create_session',
+                        lambda **kwargs: Mock(get=lambda url, **kw: response))
+
+    def pdfimages(args):
+        (path(args[-1]) + '-000.ppm').touch()
+
+    good_text = "Domnul Ion Popescu, deputat de Prahova, întreabă " * 3
+    pdf_text_layer = Mock(return_value=[good_text, "##"])
+    ocr_image = Mock(return_value="textul recunoscut")
+    check_call = Mock(side_effect=pdfimages)
+    monkeypatch.setattr(common, 'pdf_text_layer', pdf_text_layer)
+    monkeypatch.setattr(common, 'ocr_image', ocr_image)
+    monkeypatch.setattr(common.subprocess, 'check_call', check_call)
+
+    with flask.Flask('__main__').app_context():
+        stats = {}
+        first = common.ocr_url('http://example.com/a.pdf', stats=stats)
+        assert stats == {'methods': ['text', 'ocr'], 'cached': False}
+        second = common.ocr_url('http://example.com/b.pdf', stats=stats)
+        assert stats == {'methods': ['text', 'ocr'], 'cached': True}
+
+    assert first == second == [good_text, "textul recunoscut"]
+    assert pdf_text_layer.call_count == 1
+    assert ocr_image.call_count == 1
+    assert check_call.call_count == 1
@@ -0,0 +1,123 @@
+from datetime import timedelta
+import re
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+
+class FakeAdapter(BaseAdapter):
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self.etag = '"v1"'
+        self.etag_header = 'ETag'
+        self.content = b'hello'
+
+    def send(self, request, **kwargs):
+        self.sent.append(request)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers[self.etag_header] = self.etag
+        if request.headers.get('If-None-Match') == self.etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = self.content
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def cached_session(tmpdir):
+    from mptracker.scraper.common import ResponseCache, RevalidatingSession
+    cache = ResponseCache(str(tmpdir / 'cache.sqlite'))
+    session = RevalidatingSession(cache, ttl_rules=[
+        (re.compile(r'/lista'), timedelta()),
+        (re.compile(r'/nominal'), None),
+    ])
+    session.adapter = FakeAdapter()
+    session.mount('http://', session.adapter)
+    return session
+
+
+def test_immutable_page_is_served_from_cache(cached_session):
+    url = 'http://example.com/nominal?id=1'
+    assert cached_session.get(url).content == b'hello'
+    assert cached_session.get(url).content == b'hello'
+    assert len(cached_session.adapter.sent) == 1
+    assert cached_session.counters == {
+        'cache_hit': 1, 'cache_revalidated': 0, 'cache_miss': 1}
+
+
+def test_expired_page_is_revalidated(cached_session):
+    url = 'http://example.com/lista'
+    cached_session.get(url)
+    assert cached_session.get(url).content == b'hello'
+    [first, second] = cached_session.adapter.sent
+    assert 'If-None-Match' not in first.headers
+    assert second.headers['If-None-Match'] == '"v1"'
+    assert cached_session.counters == {
+        'cache_hit': 0, 'cache_revalidated': 1, 'cache_miss': 1}
+
+
+def test_validator_header_names_are_case_insensitive(cached_session):
+    url = 'http://example.com/lista'
+    cached_session.adapter.etag_header = 'etag'
+    cached_session.get(url)
+    assert cached_session.get(url).content == b'hello'
+    assert cached_session.adapter.sent[1].headers['If-None-Match'] == '"v1"'
+    assert cached_session.counters['cache_revalidated'] == 1
+
+
+def test_changed_page_is_downloaded_again(cached_session):
+    url = 'http://example.com/lista'
+    cached_session.get(url)
+    cached_session.adapter.etag = '"v2"'
+    cached_session.adapter.content = b'changed'
+    assert cached_session.get(url).content == b'changed'
+    assert cached_session.get(url).content == b'changed'
+    assert cached_session.counters == {
+        'cache_hit': 0, 'cache_revalidated': 1, 'cache_miss': 2}
+
+
+def test_streamed_response_is_not_cached(cached_session):
+    url = 'http://example.com/document.pdf'
+    assert cached_session.get(url, stream=True).content == b'hello'
+    assert cached_session.cache.get(url) is None
+
+
+def test_saved_file_serves_streamed_requests(cached_session, tmpdir):
+    url = 'http://example.com/document.pdf'
+    response = cached_session.get(url, stream=True)
+    file_path = tmpdir / 'document.pdf'
+    file_path.write_binary(response.content)
+    cached_session.cache.save_file(url, response, str(file_path))
+    assert cached_session.get(url, stream=True).content == b'hello'
+    assert len(cached_session.adapter.sent) == 1
+
+
+def test_streamed_cache_hit_iterates_content(cached_session, tmpdir):
+    url = 'http://example.com/document.pdf'
+    file_path = tmpdir / 'document.pdf'
+    file_path.write_binary(b'hello')
+    response = cached_session.get(url, stream=True)
+    cached_session.cache.save_file(url, response, str(file_path))
+    cached = cached_session.get(url, stream=True)
+    assert cached.from_cache
+    assert b''.join(cached.iter_content(2)) == b'hello'
+
+
+def test_saved_file_is_copied_in_chunks(cached_session, tmpdir):
+    import os
+    url = 'http://example.com/document.pdf'
+    response = cached_session.get(url, stream=True)
+    file_path = tmpdir / 'document.pdf'
+    for content in [os.urandom(200000), b'shorter']:
+        file_path.write_binary(content)
+        cached_session.cache.save_file(url, response, str(file_path))
+        assert cached_session.cache.get(url)['content'] == content
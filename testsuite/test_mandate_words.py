@@ -0,0 +1,78 @@
+""" The `mandate_word` triggers only exist in PostgreSQL; point
+`MPTRACKER_TEST_DATABASE` at an empty database to run these tests. """
+
+import pytest
+
+PERSON_ID = '00000000-0000-0000-0000-00000000000%d'
+MANDATE_ID = '00000000-0000-0000-0000-00000000001%d'
+PROPOSAL_ID = '00000000-0000-0000-0000-00000000002%d'
+SPONSORSHIP_ID = '00000000-0000-0000-0000-00000000003%d'
+
+
+@pytest.fixture
+def mandates(pg_app):
+    from mptracker import models
+    chamber = models.Chamber(slug='cdep')
+    models.db.session.add(chamber)
+    for n in [1, 2]:
+        models.db.session.add(models.Person(id=PERSON_ID % n,
+                                            slug='person-%d' % n))
+        models.db.session.add(models.Mandate(id=MANDATE_ID % n,
+                                             person_id=PERSON_ID % n,
+                                             chamber=chamber))
+    for n in [1, 2]:
+        models.db.session.add(models.Proposal(id=PROPOSAL_ID % n))
+    models.db.session.commit()
+
+
+def mandate_words():
+    from mptracker import models
+    rows = models.db.session.execute(
+        'SELECT mandate_id, word, count FROM mandate_word').fetchall()
+    return {(str(mandate_id)[-1], word): count
+            for mandate_id, word, count in rows}
+
+
+def bulk_update(model, records, remove=False):
+    from mptracker import models
+    from mptracker.patcher import TablePatcher
+    patcher = TablePatcher(model, models.db.session, key_columns=['id'],
+                           bulk_insert=True)
+    patcher.update(records, remove=remove)
+    models.db.session.commit()
+
+
+def test_bulk_loaded_rows_are_counted(mandates):
+    from mptracker import models
+
+    bulk_update(models.Sponsorship, [
+        {'id': SPONSORSHIP_ID % 1, 'proposal_id': PROPOSAL_ID % 1,
+         'mandate_id': MANDATE_ID % 1},
+        {'id': SPONSORSHIP_ID % 2, 'proposal_id': PROPOSAL_ID % 2,
+         'mandate_id': MANDATE_ID % 1},
+        {'id': SPONSORSHIP_ID % 3, 'proposal_id': PROPOSAL_ID % 2,
+         'mandate_id': MANDATE_ID % 2},
+    ])
+    bulk_update(models.OcrText, [
+        {'id': PROPOSAL_ID % 1, 'parent': 'proposal',
+         'text': "Legea padurilor, padurilor verzi"},
+        {'id': PROPOSAL_ID % 2, 'parent': 'proposal',
+         'text': "Legea apelor"},
+    ])
+    assert mandate_words() == {
+        ('1', 'padurilor'): 2, ('1', 'legea'): 2, ('1', 'verzi'): 1,
+        ('1', 'apelor'): 1, ('2', 'legea'): 1, ('2', 'apelor'): 1,
+    }
+
+    bulk_update(models.OcrText, [
+        {'id': PROPOSAL_ID % 2, 'parent': 'proposal',
+         'text': "Legea apelor"},
+    ], remove=True)
+    assert mandate_words() == {('1', 'legea'): 1, ('1', 'apelor'): 1,
+                               ('2', 'legea'): 1, ('2', 'apelor'): 1}
+
+    (models.Sponsorship.query
+        .filter_by(id=SPONSORSHIP_ID % 3)
+        .update({'proposal_id': PROPOSAL_ID % 1}))
+    models.db.session.commit()
+    assert mandate_words() == {('1', 'legea'): 1, ('1', 'apelor'): 1}
@@ -60,3 +60,12 @@ def test_match_stemmed_name():
     text = "azi Argeșenele se revoltă"
     match = match_names(text, ['Argeș'], [])
     assert [m['name'] for m in match] == ['Argeș']
+
+
+def test_compiled_matcher_is_reusable():
+    from mptracker.nlp import NameMatcher
+    matcher = NameMatcher(['Cluj-Napoca', 'Argeș'], ['cabinet parlamentar'])
+    first = matcher.match("azi Argeșenele din Cluj-Napoca")
+    second = matcher.match("la cabinetul parlamentar, nu la cabinet parlamentar")
+    assert [m['name'] for m in first] == ['Argeș', 'Cluj-Napoca']
+    assert [m['token'].text for m in second] == ['cabinet parlamentar']
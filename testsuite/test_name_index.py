@@ -0,0 +1,102 @@
+import pytest
+from mptracker.nlp import FuzzyNameIndex, AmbiguousName
+
+
+def make_index():
+    return FuzzyNameIndex([
+        ("Gorghiu Alina-Ştefania", 1),
+        ("Nicolăescu Gheorghe-Eugen", 2),
+        ("Ponta Victor-Viorel", 3),
+        ("Popescu Ion", 4),
+    ])
+
+
+def test_find_reordered_name_without_diacritics():
+    index = make_index()
+    assert index.find("Gheorghe Eugen Nicolaescu") == 2
+    assert index.find("Alina-Stefania Gorghiu") == 1
+
+
+def test_find_misspelled_name():
+    assert make_index().find("Ponta Victor-Vioerl", cutoff=80) == 3
+
+
+def test_unknown_name_is_not_found():
+    index = make_index()
+    assert index.find("Popescu Maria") is None
+    assert index.best_match("Ionescu Vasile") == (0, None)
+
+
+def test_discarded_value_is_not_found():
+    index = make_index()
+    index.discard(4)
+    assert index.find("Popescu Ion") is None
+
+
+def make_near_duplicates_index():
+    return FuzzyNameIndex([
+        ("Stan Ion", 1),
+        ("Stan Ioan", 2),
+        ("Bălan Ion", 3),
+        ("Balan Ioan", 4),
+    ])
+
+
+def test_exact_name_wins_over_near_duplicate():
+    index = make_near_duplicates_index()
+    assert index.find("Stan Ion") == 1
+    assert index.find("Ioan Stan") == 2
+    assert index.find("Balan Ion") == 3
+
+
+def test_close_runner_up_makes_find_ambiguous():
+    index = make_near_duplicates_index()
+    with pytest.raises(AmbiguousName) as e:
+        index.find("Stan Ionn")
+    assert e.value.values == [1, 2]
+    with pytest.raises(AmbiguousName):
+        index.find("Balan Iona")
+    assert index.best_match("Stan Ionn")[1] == 1
+
+
+def test_same_name_twice_is_ambiguous():
+    index = FuzzyNameIndex([("Popescu Ion", 1), ("Popescu Ion", 2)])
+    with pytest.raises(AmbiguousName):
+        index.find("Popescu Ion")
+
+
+def test_find_all_words():
+    index = make_index()
+    assert index.find_all_words("Victor Ponta") == [3]
+    assert index.find_all_words("Ion") == [4]
+    assert index.find_all_words("Victor Popescu") == []
+
+
+def make_name_search():
+    from collections import namedtuple
+    from mptracker.models import NameSearch
+    P = namedtuple('P', ['name'])
+    return NameSearch([
+        P("Ponta Victor-Viorel"),
+        P("Popescu Ion"),
+        P("Nicolăescu Gheorghe-Eugen"),
+    ])
+
+
+def test_name_search_finds_all_words():
+    name_search = make_name_search()
+    assert [p.name for p in name_search.find("Victor Ponta")] == \
+        ["Ponta Victor-Viorel"]
+    assert name_search.find("Victor Popescu") == []
+    assert len(name_search.find("")) == 3
+
+
+def test_name_search_finds_prefixes():
+    name_search = make_name_search()
+    assert [p.name for p in name_search.find_prefix("po")] == \
+        ["Ponta Victor-Viorel", "Popescu Ion"]
+    assert [p.name for p in name_search.find_prefix("pon vic")] == \
+        ["Ponta Victor-Viorel"]
+    assert [p.name for p in name_search.find_prefix("nicolae")] == \
+        ["Nicolăescu Gheorghe-Eugen"]
+    assert name_search.find_prefix("pox") == []
@@ -0,0 +1,61 @@
+""" The person name index is built from the database; point
+`MPTRACKER_TEST_DATABASE` at an empty database to run these tests. """
+
+import pytest
+
+PERSON_ID = '00000000-0000-0000-0000-00000000000%d'
+
+
+@pytest.fixture
+def chamber(pg_app):
+    from mptracker import models
+    from mptracker.website.dal import person_name_index
+    # the index is process-wide; don't reuse one built by another test
+    person_name_index.invalidate()
+    chamber = models.Chamber(slug='cdep')
+    models.db.session.add(chamber)
+    add_deputy(chamber, 1, "Ion", "Popescu")
+    models.db.session.commit()
+    return chamber
+
+
+def add_deputy(chamber, n, first_name, last_name):
+    from mptracker import models
+    person = models.Person(id=PERSON_ID % n, slug='person-%d' % n,
+                           name="%s %s" % (last_name, first_name),
+                           first_name=first_name, last_name=last_name)
+    models.db.session.add(person)
+    models.db.session.add(models.Mandate(person=person, chamber=chamber,
+                                         year=2012))
+
+
+def names(query):
+    from mptracker.website.dal import DataAccess
+    return [p['name'] for p in DataAccess().search_person_by_name(query)]
+
+
+def test_index_is_reused_until_people_change(chamber):
+    from mptracker.website.dal import person_name_index
+    assert names("Pope") == ["Ion Popescu"]
+    name_search = person_name_index.get()
+    assert names("Ion") == ["Ion Popescu"]
+    assert person_name_index.get() is name_search
+
+
+def test_new_person_is_found(chamber):
+    from mptracker import models
+    assert names("Ione") == []
+    add_deputy(chamber, 2, "Vasile", "Ionescu")
+    models.db.session.commit()
+    assert names("Ione") == ["Vasile Ionescu"]
+
+
+def test_renamed_person_is_found_by_new_name(chamber):
+    from mptracker import models
+    assert names("Popescu") == ["Ion Popescu"]
+    person = models.Person.query.get(PERSON_ID % 1)
+    person.name = "Popovici Ion"
+    person.last_name = "Popovici"
+    models.db.session.commit()
+    assert names("Popescu") == []
+    assert names("Popovici") == ["Ion Popovici"]
@@ -1,3 +1,4 @@
+import json
 from datetime import date
 from path import path
 
@@ -5,9 +6,7 @@ from path import path
 PAGES_DIR = path(__file__).abspath().parent / 'pages'
 
 
-def test_2013_06_10(session):
-    from mptracker.scraper.transcripts import TranscriptScraper
-
+def add_session_7277(session):
     TRANSCRIPT_URL = 'http://www.cdep.ro/pls/steno/'
     session.url_map.update({
         TRANSCRIPT_URL + 'steno.sumar?ids=7277':
@@ -37,6 +36,12 @@ def test_2013_06_10(session):
         TRANSCRIPT_URL + 'steno.stenograma?ids=7277&idm=12&idl=1':
             PAGES_DIR / 'steno.stenograma-7277-12',
     })
+
+
+def test_2013_06_10(session):
+    from mptracker.scraper.transcripts import TranscriptScraper
+
+    add_session_7277(session)
     transcript_scraper = TranscriptScraper(session)
     transcript_session = transcript_scraper.fetch_session(7277)
 
@@ -63,3 +68,29 @@ def test_2013_06_10(session):
     assert paragraphs[0]['serial'] == '07277/01-001'
     paragraph_serial_values = [p['serial'] for p in paragraphs]
     assert sorted(set(paragraph_serial_values)) == paragraph_serial_values
+
+
+def test_chapters_fetched_concurrently_keep_their_order(session):
+    from mptracker.scraper.transcripts import TranscriptScraper
+
+    add_session_7277(session)
+    serial = TranscriptScraper(session).fetch_session(7277)
+    pooled = TranscriptScraper(session, max_workers=4).fetch_session(7277)
+
+    def dump(transcript_session):
+        return [(c.serial, c.headline, c.paragraphs)
+                for c in transcript_session.chapters]
+
+    assert dump(pooled) == dump(serial)
+
+
+def test_paragraphs_match_snapshot(session):
+    from mptracker.scraper.transcripts import TranscriptScraper
+
+    add_session_7277(session)
+    transcript_session = TranscriptScraper(session).fetch_session(7277)
+    with open(PAGES_DIR / 'steno.stenograma-7277.json', encoding='utf-8') as f:
+        expected = json.load(f)
+
+    assert [{'serial': c.serial, 'paragraphs': c.paragraphs}
+            for c in transcript_session.chapters] == expected
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import date
+from path import path
+
+DAY_URL = 'http://www.cdep.ro/pls/steno/evot.data?dat=20131001'
+VOTE_URL = 'http://www.cdep.ro/pls/steno/evot.nominal?idv=%d'
+PROFILE_URL = ('http://www.cdep.ro/pls/parlam/structura.mp?'
+               'idm=%d&cam=2&leg=2012')
+
+# listed out of cdeppk order on purpose
+DAY_VOTES = [
+    (12, "Vot final PL-x 3/2013", [(1, "Popescu Ion", 'DA'),
+                                   (2, "Ionescu Vasile", 'NU')]),
+    (10, "Vot final PL-x 1/2013", [(1, "Popescu Ion", 'Abţinere'),
+                                   (2, "Ionescu Vasile", '-')]),
+    (11, "Vot final PL-x 2/2013", [(2, "Ionescu Vasile", 'DA')]),
+]
+
+
+def vote_page(subject, votes):
+    rows = ''.join(
+        '<tr><td>%d</td><td><a href="%s">%s</a></td><td>%s</td></tr>'
+        % (n, PROFILE_URL % number, name, choice)
+        for n, (number, name, choice) in enumerate(votes, 1)
+    )
+    return (
+        '<html><body>'
+        '<table><tr><td>Subiect vot:</td><td>%s</td></tr></table>'
+        '<table><tr><td>Nr. Crt.</td><td>Nume</td><td>Vot</td></tr>%s'
+        '</table></body></html>' % (subject, rows)
+    )
+
+
+def day_page(cdeppk_list):
+    rows = ''.join('<tr><td><a href="%s">vot</a></td></tr>'
+                   % (VOTE_URL % cdeppk) for cdeppk in cdeppk_list)
+    return ('<html><body><div id="pageContent"><table>%s</table></div>'
+            '</body></html>' % rows)
+
+
+def summary(voting_sessions):
+    return [
+        (vs.cdeppk, vs.subject,
+         [(v.mandate_number, v.mandate_name, v.choice) for v in vs.votes])
+        for vs in voting_sessions
+    ]
+
+
+def test_async_day_matches_serial_day(session, tmpdir):
+    from mptracker.scraper.votes import VoteScraper
+
+    def add_page(url, html):
+        file_path = path(str(tmpdir)) / ('page-%d' % len(session.url_map))
+        file_path.write_bytes(html.encode('iso-8859-2'))
+        session.url_map[url] = file_path
+
+    add_page(DAY_URL, day_page([cdeppk for cdeppk, _, _ in DAY_VOTES]))
+    for cdeppk, subject, votes in DAY_VOTES:
+        add_page(VOTE_URL % cdeppk, vote_page(subject, votes))
+
+    day = date(2013, 10, 1)
+    scraper = VoteScraper(session=session)
+    serial = summary(scraper.scrape_day(day))
+    async_ = summary(asyncio.run(scraper.scrape_day_async(day, 2)))
+    concurrent = summary(scraper.scrape_day_concurrent(day, 2))
+
+    assert [cdeppk for cdeppk, _, _ in serial] == [12, 10, 11]
+    assert serial[1][2] == [(1, "Popescu Ion", 'abstain'),
+                            (2, "Ionescu Vasile", 'novote')]
+    assert async_ == serial
+    assert concurrent == serial
+
+
+def test_get_votes_updates_session_that_moved_day(pg_app, monkeypatch):
+    from mock import Mock
+    from mptracker import models, scraper
+    from mptracker.scraper.votes import VoteScraper
+    the_date = date(2013, 10, 1)
+    models.db.session.add(models.VotingSession(
+        date=date(2013, 9, 30), cdeppk=10, subject="Vot PL-x 1/2013"))
+    models.db.session.commit()
+
+    scraped = Mock(cdeppk=10, subject="Vot final PL-x 1/2013",
+                   subject_html="Vot final PL-x 1/2013",
+                   proposal_cdeppk=None, votes=[])
+    monkeypatch.setattr(VoteScraper, 'scrape_day',
+                        lambda self, day: iter([scraped]))
+    scraper.get_votes(start=the_date.isoformat())
+
+    [voting_session] = models.VotingSession.query.all()
+    assert voting_session.date == the_date
+    assert voting_session.final
@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+import pytest
+import flask
+from mock import Mock, MagicMock
+from path import path
+
+PAGES_DIR = path(__file__).abspath().parent / 'pages'
+QUESTION_URL = ('http://www.cdep.ro/pls/parlam/'
+                'interpelari.detalii?idi=%d&idl=1')
+
+
+@pytest.fixture
+def state_app(request, monkeypatch):
+    from mptracker import models
+    app = flask.Flask('__main__')
+    models.db.init_app(app)
+    ctx = app.app_context()
+    ctx.push()
+    models.ScraperState.__table__.create(models.db.engine)
+    request.addfinalizer(ctx.pop)
+    monkeypatch.setattr(models, 'MandateLookup', Mock)
+    return app
+
+
+def last_row_is(monkeypatch, value):
+    """ Answer the "where did we stop" query of a scraper command """
+    from mptracker import models
+    monkeypatch.setattr(models.db.session, 'execute',
+                        lambda sql: Mock(scalar=lambda: value))
+
+
+def test_transcripts_retry_session_without_content(state_app, monkeypatch):
+    from mptracker import models
+    from mptracker.scraper import get_transcripts
+    from mptracker.scraper.transcripts import TranscriptScraper
+
+    fetched = []
+
+    def fetch_session(self, cdeppk):
+        fetched.append(cdeppk)
+        return None
+
+    monkeypatch.setattr(TranscriptScraper, 'fetch_session', fetch_session)
+    last_row_is(monkeypatch, '7277/12')
+    models.ScraperState.set_value('transcripts', 7277)
+
+    get_transcripts(n_sessions=2)
+    get_transcripts(n_sessions=2)
+
+    assert fetched == [7278, 7279, 7278, 7279]
+    assert models.ScraperState.get_value('transcripts') == 7277
+
+
+def test_votes_retry_day_without_votes(state_app, monkeypatch):
+    from mptracker import models, scraper
+    from mptracker.scraper.votes import VoteScraper
+
+    yesterday = date.today() - timedelta(days=1)
+    the_day_before = yesterday - timedelta(days=1)
+    scraped = []
+
+    def scrape_day(self, day):
+        scraped.append(day)
+        return []
+
+    monkeypatch.setattr(VoteScraper, 'scrape_day', scrape_day)
+    monkeypatch.setattr(scraper, 'TablePatcher', MagicMock())
+    monkeypatch.setattr(scraper, 'GroupPatcher', MagicMock())
+    monkeypatch.setattr(models.Proposal, 'query', [])
+    last_row_is(monkeypatch, the_day_before - timedelta(days=1))
+
+    scraper.get_votes()
+    scraper.get_votes()
+
+    assert scraped == [the_day_before, yesterday] * 2
+    assert models.ScraperState.get_value('votes') is None
+
+
+def test_question_run_resumes_after_marker(session, tmpdir):
+    from mptracker.scraper.questions import QuestionScraper
+
+    index_url = ('http://www.cdep.ro/pls/parlam/'
+                 'interpelari.lista?tip=&dat=2015&idl=1')
+    urls = [QUESTION_URL % n for n in range(1, 5)]
+    index_html = tmpdir / 'index.html'
+    index_html.write('<div id="pageContent"><table>%s</table></div>' %
+                     ''.join('<tr><td><a href="%s">q</a></td></tr>' % url
+                             for url in urls))
+    session.url_map[index_url] = path(str(index_html))
+    for url in urls:
+        session.url_map[url] = path(str(index_html))
+
+    scraper = QuestionScraper(session=session)
+    scraper.get_question = lambda href, page: href
+
+    assert list(scraper.run(2015, resume_after=urls[1])) == urls[2:]
+    assert list(scraper.run(2015, resume_after='gone')) == urls
@@ -0,0 +1,103 @@
+""" Full-text search runs on the PostgreSQL `*_tsv` columns; point
+`MPTRACKER_TEST_DATABASE` at an empty database to run these tests. """
+
+import pytest
+import flask
+
+PERSON_ID = '00000000-0000-0000-0000-000000000001'
+CHAPTER_ID = '00000000-0000-0000-0000-000000000002'
+TRANSCRIPT_ID = '00000000-0000-0000-0000-000000000003'
+PROPOSAL_ID = '00000000-0000-0000-0000-000000000004'
+QUESTION_ID = '00000000-0000-0000-0000-000000000005'
+
+
+@pytest.fixture
+def search_app(pg_app):
+    from mptracker import models
+    from mptracker.common import common
+    from mptracker.website.pages import pages
+    pg_app.register_blueprint(common)
+    pg_app.register_blueprint(pages)
+
+    session = models.db.session
+    session.add(models.Person(
+        id=PERSON_ID, slug='ion-popescu', first_name="Ion",
+        last_name="Popescu",
+        romania_curata="Contracte de autostrăzi și drumuri județene",
+    ))
+    session.add(models.TranscriptChapter(
+        id=CHAPTER_ID, serial='7277/1', headline="Dezbateri autostrăzi"))
+    session.add(models.Transcript(
+        id=TRANSCRIPT_ID, chapter_id=CHAPTER_ID, serial='7277/1/1',
+        text="Despre autostrăzi, autostrăzi și iar autostrăzi.",
+    ))
+    session.add(models.Proposal(id=PROPOSAL_ID, title="Legea drumurilor"))
+    session.add(models.OcrText(id=PROPOSAL_ID, parent='proposal',
+                               text="Lege privind drumurile județene"))
+    session.add(models.Question(id=QUESTION_ID,
+                                title="Întrebare despre autostrăzi"))
+    session.add(models.OcrText(id=QUESTION_ID, parent='question',
+                               text="Când se termină autostrăzile?"))
+    session.commit()
+    return pg_app
+
+
+def test_tsvector_columns_match_their_text(search_app):
+    from mptracker import models
+    from mptracker.models import FULLTEXT_COLUMNS
+    for model, column in FULLTEXT_COLUMNS:
+        sql = ("SELECT count(*) FROM {table} WHERE {column}_tsv IS DISTINCT "
+               "FROM to_tsvector('pg_catalog.romanian', {column})"
+               .format(table=model.__tablename__, column=column))
+        assert models.db.session.execute(sql).scalar() == 0
+
+    models.db.session.execute(
+        "UPDATE question SET title = 'Întrebare despre poduri'")
+    assert models.db.session.execute(
+        "SELECT title_tsv = to_tsvector('pg_catalog.romanian', title) "
+        "FROM question").scalar()
+
+
+def test_search_ranks_and_types(search_app):
+    from mptracker.website.dal import DataAccess
+    results = DataAccess().search("autostrăzi")
+    # the question matches in its title and its text, and the ranks add up;
+    # the transcript repeats the word
+    assert [(r['type'], str(r['id'])) for r in results] == [
+        ('question', QUESTION_ID),
+        ('transcript', TRANSCRIPT_ID),
+        ('person', PERSON_ID),
+    ]
+    ranks = [r['rank'] for r in results]
+    assert ranks == sorted(ranks, reverse=True)
+    assert [r['title'] for r in results] == [
+        "Întrebare despre autostrăzi", "Dezbateri autostrăzi", "Ion Popescu"]
+
+    results = DataAccess().search("drumuri județene")
+    assert sorted(r['type'] for r in results) == ['person', 'proposal']
+    assert DataAccess().search("  ") == []
+
+
+def test_search_view_links_each_result_type(search_app):
+    client = search_app.test_client()
+
+    resp = client.get('/_cauta?q=autostr%C4%83zi')
+    assert resp.status_code == 200
+    urls = [r['url'] for r in flask.json.loads(resp.data)['results']]
+    assert urls == [
+        '/intrebari-interpelari/' + QUESTION_ID,
+        '/stenograme/7277/1',
+        '/persoane/ion-popescu',
+    ]
+
+    resp = client.get('/_cauta?q=drumurile')
+    urls = [r['url'] for r in flask.json.loads(resp.data)['results']]
+    assert sorted(urls) == [
+        '/persoane/ion-popescu',
+        '/politici/propuneri/' + PROPOSAL_ID,
+    ]
+
+    for url in ['/_cauta?q=', '/_cauta']:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert flask.json.loads(resp.data) == {'results': []}
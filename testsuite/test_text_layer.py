@@ -0,0 +1,33 @@
+GOOD_TEXT = (
+    "Domnul Ion Popescu, deputat de Prahova, întreabă Ministerul "
+    "Transporturilor care este stadiul lucrărilor la autostrada "
+    "Comarnic-Brașov și când vor fi finalizate, conform Legii nr. 255/2010."
+)
+
+# what pdftotext gives for a PDF with a broken font encoding
+GARBLED_TEXT = (
+    "Hfrwm#qg ,rq#Srshvfx/#ghsxwdw#gh#Sudkryd/#vwuxfwxud#ohjloru# "
+    "Wudqvsruwxulor w#&^%$ *** ;;; ||| ~~~ ### @@@ 25:2343 ff ghh zzz "
+    "qgw/#kwws=22zzz1 vkmkw ## 9%% Ò×ÕÖ Ò×ÕÖ Ò×ÕÖ Ò×ÕÖ Ò×ÕÖ Ò×ÕÖ"
+)
+
+
+def test_real_text_is_usable():
+    from mptracker.common import is_usable_text
+    assert is_usable_text(GOOD_TEXT)
+
+
+def test_garbled_text_is_not_usable():
+    from mptracker.common import is_usable_text
+    assert not is_usable_text(GARBLED_TEXT)
+
+
+def test_short_text_is_not_usable():
+    from mptracker.common import is_usable_text
+    assert not is_usable_text("Domnul Ion Popescu, deputat de Prahova")
+
+
+def test_punctuation_does_not_count_as_text():
+    from mptracker.common import is_usable_text
+    words = "Domnul Ion Popescu, deputat de Prahova".split()
+    assert not is_usable_text(' '.join(w + '.' * 20 for w in words))